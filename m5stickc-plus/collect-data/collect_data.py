@@ -2,6 +2,7 @@ import math
 import matplotlib.pyplot as plt
 import numpy as np
 import serial
+import sys
 
 # M5StickC Plus の MPU6866 の値を Bluetooth で受信してデータを集める
 # 収集例:
@@ -39,7 +40,7 @@ acc_z_list = []
 
 # cf. [M5Stick-CからMacにBluetoothで文字列を送信する - plant-raspberrypi3のブログ](https://plant-raspberrypi3.hatenablog.com/entry/2020/12/14/232112)
 # cf. [Pythonのpyserialとthreadingでリアルタイムなシリアル通信をする。 #電子工作 - Qiita](https://qiita.com/tapitapi/items/1dd9c66c0dff061bcd82)
-port = '/dev/tty.M5StickCPlus' # NOTE 自分の環境に合わせて変更する
+port = sys.argv[1] if len(sys.argv) > 1 else '/dev/tty.M5StickCPlus' # NOTE 自分の環境に合わせて変更する (virtual-device の仮想デバイスを使う場合は表示されたパスを引数で渡す)
 m5_stick_c_plus = serial.Serial(port, timeout=3)
 while True:
     line = m5_stick_c_plus.readline().strip().decode('utf-8')
@@ -0,0 +1,30 @@
+import time
+
+import numpy as np
+from kalman_filter import VectorKalmanFilter
+
+# 観測値を一度に取り込む場合 (batch) と 1 つずつ取り込む場合 (sequential) で，filter 1 回にかかる時間を比べる
+# 状態の次元は 3: 加速度 (ランダムウォーク), 6: 加速度とその変化率, 9: さらにその変化率, 以降は比較のため
+# 観測値は加速度の x, y, z の 3 つ (R は collect_data で求めた対角行列) の場合と，状態と同じ次元の場合を試す
+rng = np.random.default_rng(0)
+acc_R = np.array([0.000081, 0.000062, 0.000056])
+
+def measure(H, R, P_0, sequential: bool) -> float:
+    n = len(P_0)
+    kalman_filter = VectorKalmanFilter(np.eye(n), np.eye(n), H, 1e-4 * np.eye(n), R, np.zeros(n), P_0, sequential=sequential)
+    y = rng.normal(size=len(H))
+    n_steps = max(20, 20000 // len(H))
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        kalman_filter.filter(y)
+    return (time.perf_counter() - start) / n_steps
+
+for n in [3, 6, 9, 12, 24, 48, 96]:
+    A = rng.normal(size=(n, n))
+    P_0 = A @ A.T / n + np.eye(n)
+    H_acc = np.zeros((3, n))
+    H_acc[:, :3] = np.eye(3) # 状態の最初の 3 つが加速度
+    for (name, H, R) in [('acc', H_acc, acc_R), ('full', np.eye(n), np.full(n, 1e-4))]:
+        batch = measure(H, R, P_0, sequential=False)
+        sequential = measure(H, R, P_0, sequential=True)
+        print(f'state: {n:2d}, observation: {len(H):2d} ({name}), batch: {batch * 1e6:8.2f} us, sequential: {sequential * 1e6:8.2f} us, batch / sequential: {batch / sequential:.2f}')
@@ -0,0 +1,75 @@
+import numpy as np
+from kalman_filter import AdaptiveKalmanFilter, FixedLagSmoother, KalmanFilter, VectorKalmanFilter
+from motion_models import ConstantVelocity
+
+# monitor_data.py と同じ Q, R と gate で，外れ値を捨てる処理が実際の動きを止めないこと，
+# および壊れた行 (小数点の欠落) が AdaptiveKalmanFilter の Q, R の推定を壊さないことを確かめる
+rng = np.random.default_rng(0)
+acc_Q = np.array([0.000093, 0.000103, 0.000038])
+acc_R = np.array([0.000081, 0.000062, 0.000056])
+gate = 10.83
+max_rejections = 3
+n_steps = 300
+step = 100 # この時点で x が 0.0 G から 0.5 G に変わる (30 度傾けた)
+
+mean = np.tile([0.0, 0.0, 1.0], (n_steps, 1))
+mean[step:, 0] = 0.5
+ys = mean + rng.normal(0.0, np.sqrt(acc_R), (n_steps, 3))
+
+def run(kalman_filter, ys, x_f=lambda s: s.x_f) -> np.ndarray:
+    xs = np.empty_like(ys)
+    for (t, y) in enumerate(ys):
+        kalman_filter.filter(y)
+        xs[t] = x_f(kalman_filter.state)
+        kalman_filter.predict()
+    return xs
+
+def recovery(xs) -> int:
+    # 傾けてから x の事後推定値が 0.45 G を超えるまでのサンプル数 (最後まで超えなければ残りのサンプル数)
+    caught_up = xs[step:, 0] > 0.45
+    return int(np.argmax(caught_up)) if caught_up.any() else len(caught_up)
+
+# 1. 値が変わったときに何サンプルで追いつくか
+model = ConstantVelocity(q=0.01)
+dim = model.dim
+(F, Q) = model.discretize(0.01, axes=3)
+H = np.kron(np.eye(3), np.eye(1, dim))
+x_0 = np.kron([0.0, 0.0, 1.0], np.eye(1, dim)[0])
+P_0 = np.diag(np.kron(acc_Q, np.ones(dim)))
+filters = {
+    'KalmanFilter': lambda m: KalmanFilter(1.0, 1.0, 1.0, acc_Q, acc_R, x_0=[0.0, 0.0, 1.0], P_0=acc_Q, gate=gate, max_rejections=m),
+    'AdaptiveKalmanFilter': lambda m: AdaptiveKalmanFilter(1.0, 1.0, 1.0, acc_Q, acc_R, x_0=[0.0, 0.0, 1.0], P_0=acc_Q, window=200, gate=gate, max_rejections=m),
+    'VectorKalmanFilter (sequential)': lambda m: VectorKalmanFilter(F, np.eye(3 * dim), H, Q, acc_R, x_0=x_0, P_0=P_0, sequential=True, gate=gate, max_rejections=m),
+    'VectorKalmanFilter (batch)': lambda m: VectorKalmanFilter(F, np.eye(3 * dim), H, Q, acc_R, x_0=x_0, P_0=P_0, gate=gate, max_rejections=m),
+}
+for (name, make) in filters.items():
+    x_f = (lambda s: s.x_f[::dim]) if name.startswith('Vector') else (lambda s: s.x_f)
+    without = recovery(run(make(None), ys, x_f))
+    with_limit = recovery(run(make(max_rejections), ys, x_f))
+    print(f'{name}: recovered after {with_limit} samples (max_rejections=None: {without} samples)')
+    assert with_limit <= max_rejections + 2
+
+# FixedLagSmoother: 受け入れた時点の平滑化推定値も追いつくこと (現在の時点の行は x_f と同じになること)
+lag = 5
+for m in [None, max_rejections]:
+    smoother = FixedLagSmoother(filters['KalmanFilter'](m), lag)
+    xs = np.empty_like(ys)
+    lag_0 = 0.0
+    for (t, y) in enumerate(ys):
+        smoother.filter(y)
+        lag_0 = max(lag_0, np.max(np.abs(smoother.x_s[smoother.head] - smoother.kalman_filter.state.x_f)))
+        if smoother.ready:
+            xs[t - lag] = smoother.smoothed()[0]
+        smoother.predict()
+    xs[n_steps - lag:] = np.nan
+    print(f'FixedLagSmoother (lag={lag}, max_rejections={m}): smoothed value recovered after {recovery(xs)} samples, max |x_s(lag 0) - x_f| = {lag_0:.3g}')
+assert recovery(xs) <= max_rejections + 2 and lag_0 < 1e-9
+
+# 2. 壊れた行 (1 つ目の値の小数点が欠けた) が 1 つ混ざったときの AdaptiveKalmanFilter の Q, R
+ys = mean[:step] + rng.normal(0.0, np.sqrt(acc_R), (step, 3))
+ys[50, 0] = -216.0
+for g in [None, gate]:
+    kalman_filter = AdaptiveKalmanFilter(1.0, 1.0, 1.0, acc_Q, acc_R, x_0=[0.0, 0.0, 1.0], P_0=acc_Q, window=200, gate=g, max_rejections=max_rejections)
+    run(kalman_filter, ys)
+    print(f'AdaptiveKalmanFilter (gate={g}) after a glitch: Q_x = {kalman_filter.Q[0]:.3g}, R_x = {kalman_filter.R[0]:.3g}, rejected = {kalman_filter.rejected}')
+assert kalman_filter.Q[0] < 1e-3 and kalman_filter.R[0] < 1e-3
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# 各クラスの checkpoint_fields に挙げた属性 (推定値，推定し直したノイズの分散，履歴のリングバッファなど) を保存する
+# モデルのパラメータなどの設定は保存しないので，設定を変えて再起動すれば新しい設定が使われる
+# 保存した属性から作り直せるもの (MinMaxPyramid のレベル 1 以上など) は，元に戻したあとに checkpoint_restored で作り直す
+
+def snapshot(objects: dict) -> dict:
+    """objects の状態を配列の辞書にコピーする
+
+    Parameters
+    ----------
+    objects: dict[str, object]
+        名前と，checkpoint_fields を持つオブジェクト (None は無視する)
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        '名前.属性.属性' をキーとする配列の辞書 (元のオブジェクトとはメモリを共有しない)
+    """
+    arrays = {}
+    seen = set()
+    for (name, obj) in objects.items():
+        if obj is not None:
+            _collect(name, obj, arrays, seen)
+    return arrays
+
+def _collect(key: str, value, arrays: dict, seen: set) -> None:
+    if isinstance(value, np.ndarray):
+        if id(value) not in seen: # 同じ配列を 2 回保存しない
+            seen.add(id(value))
+            arrays[key] = value.copy()
+    elif isinstance(value, (int, float, np.integer, np.floating)):
+        arrays[key] = np.array(value)
+    elif isinstance(value, (list, tuple)):
+        for (i, v) in enumerate(value):
+            _collect(f'{key}.{i}', v, arrays, seen)
+    else:
+        if id(value) in seen: # FixedLagSmoother の kalman_filter など，別の名前で保存済みのもの
+            return
+        seen.add(id(value))
+        for field in type(value).checkpoint_fields:
+            _collect(f'{key}.{field}', getattr(value, field), arrays, seen)
+
+def restore(objects: dict, arrays: dict) -> bool:
+    """snapshot で作った配列の辞書から objects の状態を元に戻す
+
+    配列の形が今のオブジェクトと合わない (設定が変わった) 場合は何も書き換えずに False を返す．
+
+    Parameters
+    ----------
+    objects: dict[str, object]
+        名前と，checkpoint_fields を持つオブジェクト (None は無視する)
+    arrays: dict[str, np.ndarray]
+        snapshot の結果
+
+    Returns
+    -------
+    bool
+        元に戻したか
+    """
+    current = snapshot(objects)
+    if current.keys() != arrays.keys() or any(current[k].shape != arrays[k].shape for k in current):
+        return False
+    seen = set()
+    for (name, obj) in objects.items():
+        if obj is not None:
+            _restore(name, obj, arrays, seen)
+    return True
+
+def _restore(key: str, obj, arrays: dict, seen: set) -> None:
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    for field in type(obj).checkpoint_fields:
+        _restore_field(f'{key}.{field}', obj, field, getattr(obj, field), arrays, seen)
+    restored = getattr(obj, 'checkpoint_restored', None)
+    if restored is not None:
+        restored()
+
+def _restore_field(key: str, owner, field, value, arrays: dict, seen: set) -> None:
+    if isinstance(value, np.ndarray):
+        if key in arrays:
+            np.copyto(value, arrays[key]) # 配列は書き換えるだけ (履歴バッファのビューなどがそのまま使える)
+    elif isinstance(value, (int, float, np.integer, np.floating)):
+        setattr(owner, field, type(value)(arrays[key]))
+    elif isinstance(value, (list, tuple)):
+        for (i, v) in enumerate(value):
+            _restore_field(f'{key}.{i}', None, None, v, arrays, seen)
+    else:
+        _restore(key, value, arrays, seen)
+
+def load(path: str):
+    """保存したスナップショットを読み込む
+
+    Parameters
+    ----------
+    path: str
+        ファイルのパス
+
+    Returns
+    -------
+    dict[str, np.ndarray] | None
+        snapshot の結果 (ファイルがない場合は None)
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as npz:
+        return {k: npz[k] for k in npz.files}
+
+class CheckpointWriter:
+    """スナップショットを別スレッドでファイルに書き込む
+
+    呼び出し側 (サンプルのループ) は配列をコピーして渡すだけで，ディスクへの書き込みは待たない．
+    書き込みが終わる前に次のスナップショットが渡された場合は，古いものは書かずに新しいものだけを書く．
+    一時ファイルに書いて fsync してから os.replace で置き換えるので，途中で止まっても壊れたファイルは残らない．
+
+    Attributes
+    ----------
+    path: str
+        書き込むファイルのパス (.npz)
+    interval: float
+        maybe_save で保存する間隔 [s]
+    saved: int
+        これまでに書き込んだ回数
+    """
+
+    def __init__(self, path: str, interval: float = 10.0):
+        """
+        Parameters
+        ----------
+        path: str
+            書き込むファイルのパス (.npz)
+        interval: float
+            maybe_save で保存する間隔 [s]
+        """
+        self.path = path
+        self.interval = interval
+        self.saved = 0
+        self._last = time.monotonic()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def maybe_save(self, objects: dict) -> bool:
+        """前回から interval 秒以上経っていれば objects のスナップショットを保存する
+
+        Parameters
+        ----------
+        objects: dict[str, object]
+            snapshot に渡すもの
+
+        Returns
+        -------
+        bool
+            保存したか
+        """
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return False
+        self._last = now
+        self.submit(snapshot(objects))
+        return True
+
+    def submit(self, arrays: dict) -> None:
+        """スナップショットを書き込み待ちにする (待たずに戻る)
+
+        Parameters
+        ----------
+        arrays: dict[str, np.ndarray]
+            snapshot の結果
+        """
+        with self._lock:
+            self._pending = arrays
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """書き込み待ちのスナップショットを書いてからスレッドを止める"""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                (arrays, self._pending) = (self._pending, None)
+            if arrays is not None:
+                self._write(arrays)
+            if self._closed and self._pending is None:
+                return
+
+    def _write(self, arrays: dict) -> None:
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **arrays) # 圧縮もこのスレッドで行う
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.saved += 1
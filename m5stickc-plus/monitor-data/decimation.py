@@ -0,0 +1,156 @@
+import numpy as np
+
+class MinMaxPyramid:
+    """履歴のリングバッファと，その最小値・最大値の多重解像度ピラミッド
+
+    レベル 0 はサンプルそのもののリングバッファで，レベル k の 1 要素はレベル 0 の連続する 2^k サンプルの最小値と最大値を持つ．
+    サンプルを追加するたびに，そのサンプルを含む各レベルの要素だけを更新する (1 サンプルあたり O(レベル数))．
+    描画するときは，表示する範囲のサンプル数が画面のピクセル数以下になる粗さのレベルを選んで，その最小値と最大値だけを描く．
+
+    Attributes
+    ----------
+    capacity: int
+        保持するサンプル数 (2 のべき乗に切り上げる)
+    count: int
+        これまでに追加したサンプルの数
+    levels: list[tuple[np.ndarray, np.ndarray]]
+        レベル k の (最小値, 最大値)．形は (チャンネル数, capacity / 2^k) で，レベル 0 は同じ配列を 2 つ持つ
+    raw: np.ndarray
+        レベル 0 の配列 (サンプルそのもののリングバッファ)
+    """
+
+    # checkpoint.py で保存する属性 (レベル 1 以上はレベル 0 から作り直せるので保存しない)
+    checkpoint_fields = ('count', 'raw')
+
+    def __init__(self, channels: int, size: int):
+        """
+        Parameters
+        ----------
+        channels: int
+            チャンネル数
+        size: int
+            保持するサンプル数
+        """
+        self.capacity = 1 << max(size - 1, 0).bit_length()
+        self.count = 0
+        raw = np.zeros((channels, self.capacity))
+        self.levels = [(raw, raw)]
+        n = self.capacity >> 1
+        while n >= 1:
+            self.levels.append((np.zeros((channels, n)), np.zeros((channels, n))))
+            n >>= 1
+
+    @property
+    def raw(self) -> np.ndarray:
+        return self.levels[0][0]
+
+    def rebuild(self) -> None:
+        """レベル 0 と count から，レベル 1 以上の最小値と最大値を作り直す
+
+        advance を繰り返した場合と同じ値になる (書き込み途中のブロックは，そのブロックのうち書き込み済みのサンプルだけを使う)．
+        """
+        i = self.count % self.capacity
+        raw = self.raw
+        for k in range(1, len(self.levels)):
+            (lo, hi) = self.levels[k]
+            (lo_prev, hi_prev) = self.levels[k - 1]
+            np.minimum(lo_prev[:, 0::2], lo_prev[:, 1::2], out=lo)
+            np.maximum(hi_prev[:, 0::2], hi_prev[:, 1::2], out=hi)
+        # 書き込み途中のブロックの残りは前の周回の古いサンプルなので，書き込み済みの部分だけで計算し直す
+        for k in range(1, len(self.levels)):
+            j = i >> k
+            if i & ((1 << k) - 1) != 0:
+                (lo, hi) = self.levels[k]
+                np.min(raw[:, j << k:i], axis=1, out=lo[:, j])
+                np.max(raw[:, j << k:i], axis=1, out=hi[:, j])
+
+    def checkpoint_restored(self) -> None:
+        """checkpoint.restore で count とレベル 0 を元に戻したあとに呼ばれる"""
+        self.rebuild()
+
+    def head(self) -> np.ndarray:
+        """次のサンプルを書き込むレベル 0 の列 (ビュー) を返す
+
+        KalmanFilter.filter の out に渡すなどして値を書き込んだあと，advance を呼ぶ．
+        """
+        return self.levels[0][0][:, self.count % self.capacity]
+
+    def advance(self) -> None:
+        """head に書き込んだサンプルを確定して，各レベルの最小値と最大値を更新する"""
+        i = self.count % self.capacity
+        value = self.levels[0][0][:, i]
+        for k in range(1, len(self.levels)):
+            (lo, hi) = self.levels[k]
+            j = i >> k
+            if i & ((1 << k) - 1) == 0: # ブロックの最初のサンプルなので，古い値を捨てて置き換える
+                lo[:, j] = value
+                hi[:, j] = value
+            else:
+                np.minimum(lo[:, j], value, out=lo[:, j])
+                np.maximum(hi[:, j], value, out=hi[:, j])
+        self.count += 1
+
+    def append(self, value) -> None:
+        """サンプルを追加する
+
+        Parameters
+        ----------
+        value: array_like
+            チャンネルごとの値
+        """
+        np.copyto(self.head(), value)
+        self.advance()
+
+    def query(self, size: int, width: int) -> tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        """直近 size サンプルを width 点程度に間引いた最小値と最大値を返す
+
+        Parameters
+        ----------
+        size: int
+            表示するサンプル数
+        width: int
+            表示に使える点の数 (画面のピクセル数)
+
+        Returns
+        -------
+        level: int
+            使ったレベル
+        t: np.ndarray
+            各点の時点 (最初のサンプルからの通し番号)
+        lo: np.ndarray
+            各点の最小値 (チャンネル数, 点の数)
+        hi: np.ndarray
+            各点の最大値 (チャンネル数, 点の数)
+        """
+        size = min(size, self.count, self.capacity)
+        width = max(width, 1)
+        level = 0
+        while level + 1 < len(self.levels) and (size >> level) > width:
+            level += 1
+        block = 1 << level
+        start = self.count - size
+        first = -(-start // block) # 一部が表示範囲の外にあるブロックは捨てる (捨てるのは 1 点未満)
+        last = (self.count - 1) >> level # 最後のブロックは書き込み途中でもよい
+        blocks = np.arange(first, last + 1)
+        (lo, hi) = self.levels[level]
+        slots = blocks % lo.shape[1]
+        return (level, blocks * block, lo[:, slots], hi[:, slots])
+
+def envelope(t: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """最小値と最大値を交互に並べて，1 本の折れ線で描けるようにする
+
+    1 ピクセルの中を縦に往復する線になるので，すべてのサンプルを描いたときとほぼ同じ見た目になる．
+
+    Parameters
+    ----------
+    t: np.ndarray
+        各点の時点
+    lo, hi: np.ndarray
+        1 チャンネル分の各点の最小値と最大値
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        折れ線の x 座標と y 座標
+    """
+    return (np.repeat(t, 2), np.column_stack((lo, hi)).ravel())
@@ -0,0 +1,825 @@
+import numpy as np
+
+class KalmanFilterState:
+    """カルマンフィルタの状態
+
+    複数チャンネル (加速度の x, y, z 軸など) の値をチャンネルごとの配列にまとめて持つ (struct of arrays)．
+    filter / predict はこの配列を書き換えるだけなので，サンプルごとに新しいオブジェクトが作られない．
+
+    Attributes
+    ----------
+    x_p: np.ndarray
+        事前推定値
+    P_p: np.ndarray
+        事前推定誤差の分散
+    x_f: np.ndarray
+        事後推定値
+    P_f: np.ndarray
+        事後推定誤差の分散
+    """
+
+    __slots__ = ('x_p', 'P_p', 'x_f', 'P_f')
+    checkpoint_fields = ('x_p', 'P_p', 'x_f', 'P_f') # checkpoint.py で保存する属性
+
+    def __init__(self, x_0, P_0):
+        """
+        Parameters
+        ----------
+        x_0: array_like
+            事前推定値の初期値
+        P_0: array_like
+            事前推定誤差の分散の初期値
+        """
+        self.x_p = np.array(x_0, dtype=np.float64)
+        self.P_p = np.array(P_0, dtype=np.float64)
+        self.x_f = np.zeros_like(self.x_p) # まだ何もフィルタリングしていないということ (0.0 という値に意味はない)
+        self.P_f = np.zeros_like(self.P_p) # まだ何もフィルタリングしていないということ (0.0 という値に意味はない)
+
+def robust_weight(d2, robust, huber_k: float = 1.345, student_nu: float = 4.0, dim: int = 1, out=None) -> np.ndarray:
+    """イノベーションの大きさから，観測値の重み (観測誤差の分散を 1 / 重み 倍にする) を求める
+
+    Parameters
+    ----------
+    d2: np.ndarray
+        イノベーションのマハラノビス距離の 2 乗 (スカラーの観測値なら e^2 / S)
+    robust: str | None
+        'huber' なら Huber の重み min(1, huber_k / d)，'student-t' なら自由度 student_nu の t 分布の重み
+        (student_nu + dim) / (student_nu + d^2)，None なら 1
+    huber_k: float
+        Huber の重みの閾値
+    student_nu: float
+        t 分布の自由度
+    dim: int
+        観測値の次元
+    out: np.ndarray, optional
+        結果を書き込む配列
+
+    Returns
+    -------
+    np.ndarray
+        観測値の重み
+    """
+    if out is None:
+        out = np.empty_like(d2)
+    if robust is None:
+        out.fill(1.0)
+    elif robust == 'huber':
+        np.sqrt(d2, out=out)
+        np.maximum(out, huber_k, out=out)
+        np.divide(huber_k, out, out=out)
+    elif robust == 'student-t':
+        np.add(d2, student_nu, out=out)
+        np.divide(student_nu + dim, out, out=out)
+    else:
+        raise ValueError(f'unknown robust update: {robust}')
+    return out
+
+class KalmanFilter:
+    """チャンネルごとに独立なスカラーのカルマンフィルタをまとめたもの
+
+    filter → predict → filter → predict → ... のように filter と predict を交互に呼んで，state を更新していく．
+    途中の計算は作業用の配列で行い，結果は state の配列に直接書き込む (サンプルごとのメモリ確保をしない)．
+    チャンネルの配列は 1 次元でなくてもよい ((トラック数, 軸の数) など)．
+
+    gate を指定すると，イノベーション e = y - H x_p の正規化した 2 乗 e^2 / S (S = H^2 P_p + R) が gate を超えた
+    チャンネルの観測値は外れ値として捨てる (事後推定値は事前推定値のまま)．
+    実際に値が大きく変わった (M5StickC Plus を傾けたなど) 場合も外れ値に見えるので，max_rejections を指定すると，
+    同じチャンネルで続けて max_rejections 回捨てたときは値が変わったとみなし，事前推定誤差の分散を e^2 / H^2 まで広げて
+    その観測値を受け入れる (事後推定値はほぼ観測値に追いつく)．
+    robust を指定すると，e^2 / S に応じて観測誤差の分散を R / w に膨らませる (w は robust_weight の重み)．
+    どちらも全チャンネルまとめて配列の演算で行う．
+
+    Attributes
+    ----------
+    F, G, H, Q, R: np.ndarray
+        チャンネルごとのモデルのパラメータ
+    gate: float | None
+        外れ値とみなす e^2 / S の閾値 (例えば自由度 1 のカイ二乗分布の 99.9% 点は 10.83)
+    max_rejections: int | None
+        続けて捨てる観測値の数の上限 (None なら上限なし)
+    robust: str | None
+        'huber' または 'student-t' (robust_weight を参照)
+    huber_k, student_nu: float
+        robust_weight のパラメータ
+    rejected: np.ndarray
+        チャンネルごとの，これまでに外れ値として捨てた観測値の数
+    consecutive: np.ndarray
+        チャンネルごとの，直近で続けて捨てた観測値の数
+    state: KalmanFilterState
+        推定値と推定誤差の分散
+    """
+
+    __slots__ = ('F', 'G', 'H', 'Q', 'R', 'gate', 'max_rejections', 'robust', 'huber_k', 'student_nu', 'rejected', 'consecutive', 'state', '_PH', '_K', '_e', '_w', '_outlier', '_reset')
+    checkpoint_fields = ('state', 'rejected', 'consecutive') # checkpoint.py で保存する属性
+
+    def __init__(self, F, G, H, Q, R, x_0, P_0, gate=None, robust=None, huber_k: float = 1.345, student_nu: float = 4.0, max_rejections=None):
+        """
+        Parameters
+        ----------
+        F, G, H, Q, R: array_like
+            チャンネルごとのモデルのパラメータ (スカラーを渡すと全チャンネル共通になる)
+        x_0: array_like
+            事前推定値の初期値
+        P_0: array_like
+            事前推定誤差の分散の初期値 (スカラーを渡すと全チャンネル共通になる)
+        gate: float, optional
+            外れ値とみなす e^2 / S の閾値
+        robust: str, optional
+            'huber' または 'student-t'
+        huber_k, student_nu: float
+            robust_weight のパラメータ
+        max_rejections: int, optional
+            続けて捨てる観測値の数の上限
+        """
+        shape = np.shape(x_0)
+        self.state = KalmanFilterState(x_0, np.broadcast_to(np.array(P_0, dtype=np.float64), shape))
+        self.F = np.broadcast_to(np.array(F, dtype=np.float64), shape).copy()
+        self.G = np.broadcast_to(np.array(G, dtype=np.float64), shape).copy()
+        self.H = np.broadcast_to(np.array(H, dtype=np.float64), shape).copy()
+        self.Q = np.broadcast_to(np.array(Q, dtype=np.float64), shape).copy()
+        self.R = np.broadcast_to(np.array(R, dtype=np.float64), shape).copy()
+        self.gate = gate
+        self.max_rejections = max_rejections
+        self.robust = robust
+        self.huber_k = huber_k
+        self.student_nu = student_nu
+        self.rejected = np.zeros(shape, dtype=np.int64)
+        self.consecutive = np.zeros(shape, dtype=np.int64)
+        self._PH = np.empty(shape)
+        self._K = np.empty(shape)
+        self._e = np.empty(shape)
+        self._w = np.empty(shape)
+        self._outlier = np.zeros(shape, dtype=bool)
+        self._reset = np.empty(shape, dtype=bool)
+
+    def filter(self, y, out=None) -> None:
+        """観測値を受け取って事後推定値を更新する
+
+        事後推定値 state.x_f と事後推定誤差 state.P_f が更新される．
+
+        Parameters
+        ----------
+        y: np.ndarray
+            チャンネルごとの観測値
+        out: np.ndarray, optional
+            指定した場合，事後推定値をこの配列 (履歴バッファのビューなど) にも書き込む
+        """
+        s = self.state
+        PH = self._PH
+        K = self._K
+        e = self._e
+        np.multiply(s.P_p, self.H, out=PH)
+        np.multiply(PH, self.H, out=K)
+        K += self.R # S
+        np.multiply(self.H, s.x_p, out=e)
+        np.subtract(y, e, out=e) # イノベーション
+        weighted = self.gate is not None or self.robust is not None
+        changed = self._weight(e, K) if weighted else False
+        if self._observe(y) or changed: # P_p または R が変わった
+            np.multiply(s.P_p, self.H, out=PH)
+            np.multiply(PH, self.H, out=K)
+            K += self.R # S
+        if weighted:
+            # K = P_p H w / (H^2 P_p w + R) (w = 0 なら K = 0 で，観測値を使わない)
+            K -= self.R
+            K *= self._w
+            K += self.R
+            np.divide(PH, K, out=K)
+            K *= self._w
+        else:
+            np.divide(PH, K, out=K) # カルマンゲイン
+        e *= K
+        np.add(s.x_p, e, out=s.x_f)
+        np.multiply(K, PH, out=e)
+        np.subtract(s.P_p, e, out=s.P_f)
+        if out is not None:
+            np.copyto(out, s.x_f)
+
+    def _observe(self, y) -> bool:
+        # 重みが決まった後，カルマンゲインを計算する前に呼ばれる (R を推定し直した場合は True を返す)
+        return False
+
+    def _weight(self, e, S) -> bool:
+        # w に観測値の重みを，外れ値のチャンネルは 0 にして書き込む (P_p を広げた場合は True を返す)
+        w = self._w
+        outlier = self._outlier
+        np.square(e, out=w)
+        w /= S # e^2 / S
+        if self.gate is not None:
+            np.greater(w, self.gate, out=outlier)
+            self.rejected += outlier
+            self.consecutive += outlier
+            self.consecutive *= outlier # 受け入れたチャンネルは 0 に戻す
+        robust_weight(w, self.robust, self.huber_k, self.student_nu, out=w)
+        if self.gate is not None:
+            w[outlier] = 0.0
+            if self.max_rejections is not None:
+                reset = np.greater_equal(self.consecutive, self.max_rejections, out=self._reset)
+                if reset.any():
+                    # 値が変わったとみなし，事前推定誤差の分散を e^2 / H^2 まで広げて観測値を受け入れる
+                    P_p = self.state.P_p
+                    P_p[reset] = np.maximum(P_p, np.square(e / self.H))[reset]
+                    w[reset] = 1.0
+                    outlier[reset] = False
+                    self.rejected -= reset
+                    self.consecutive[reset] = 0
+                    return True
+        return False
+
+    def predict(self, out=None) -> None:
+        """事前推定値を更新する
+
+        事前推定値 state.x_p と事前推定誤差 state.P_p が更新される．
+
+        Parameters
+        ----------
+        out: np.ndarray, optional
+            指定した場合，事前推定値をこの配列にも書き込む
+        """
+        s = self.state
+        tmp = self._e
+        np.multiply(self.F, s.x_f, out=s.x_p)
+        np.multiply(self.F, self.F, out=s.P_p)
+        s.P_p *= s.P_f
+        np.multiply(self.G, self.G, out=tmp)
+        tmp *= self.Q
+        s.P_p += tmp
+        if out is not None:
+            np.copyto(out, s.x_p)
+
+class AdaptiveKalmanFilter(KalmanFilter):
+    """観測値から Q, R をオンラインで推定し直すカルマンフィルタ (共分散マッチング)
+
+    y_t = H x_t + v_t, x_t = F x_{t - 1} + G w_{t - 1} より，d_t = y_t - F y_{t - 1} = H G w_{t - 1} + v_t - F v_{t - 1} なので，
+      V[d_t] = H^2 G^2 Q + (1 + F^2) R
+      Cov[d_t, d_{t - 1}] = -F R
+    となる．この 2 つを指数移動平均で推定し，
+      R = -Cov[d_t, d_{t - 1}] / F
+      Q = (V[d_t] - (1 + F^2) R) / (H^2 G^2)
+    で Q, R を更新してから観測更新する．指数移動平均は窓幅 window のスライディングウィンドウの代わりで，
+    1 サンプルあたり O(1) で更新でき，過去の観測値は直前の 1 つしか保存しなくてよい．
+    動かしている間に状況 (机の上 / 手の上など) が変わっても Q, R が追従する．
+    gate や robust を指定した場合，y_t の代わりに重みを掛けた H x_p + w e を使う (捨てた観測値は Q, R の推定に使わない)．
+    (F = 0 のチャンネルでは R を推定できないので，F は 0 でないものとする)
+
+    Attributes
+    ----------
+    C_0: np.ndarray
+        V[d_t] の推定値
+    C_1: np.ndarray
+        Cov[d_t, d_{t - 1}] の推定値
+    y_prev: np.ndarray
+        直前の観測値
+    d_prev: np.ndarray
+        直前の d_t
+    n: int
+        これまでに受け取った観測値の数
+    window: int
+        指数移動平均の実効的な窓幅
+    Q_min, R_min: np.ndarray
+        Q, R の下限 (推定値が 0 以下になって発散しないようにする)
+    """
+
+    __slots__ = ('C_0', 'C_1', 'y_prev', 'd_prev', 'n', 'window', 'Q_min', 'R_min', '_a', '_d', '_y', '_tmp')
+    checkpoint_fields = KalmanFilter.checkpoint_fields + ('Q', 'R', 'C_0', 'C_1', 'y_prev', 'd_prev', 'n') # 推定し直した Q, R も保存する
+
+    def __init__(self, F, G, H, Q, R, x_0, P_0, window: int = 100, Q_min=1e-9, R_min=1e-9, **kwargs):
+        """
+        Parameters
+        ----------
+        F, G, H, Q, R: array_like
+            チャンネルごとのモデルのパラメータ (Q, R は推定の初期値になる)
+        x_0: array_like
+            事前推定値の初期値
+        P_0: array_like
+            事前推定誤差の分散の初期値 (スカラーを渡すと全チャンネル共通になる)
+        window: int
+            指数移動平均の実効的な窓幅
+        Q_min, R_min: array_like
+            Q, R の下限
+        **kwargs
+            KalmanFilter の gate, robust など
+        """
+        super().__init__(F, G, H, Q, R, x_0, P_0, **kwargs)
+        shape = self.state.x_p.shape
+        # 初期値は Q, R の初期値から決まる値
+        self.C_0 = self.H ** 2 * self.G ** 2 * self.Q + (1.0 + self.F ** 2) * self.R
+        self.C_1 = -self.F * self.R
+        self.y_prev = np.zeros(shape)
+        self.d_prev = np.zeros(shape)
+        self.n = 0
+        self.window = window
+        self.Q_min = np.broadcast_to(np.array(Q_min, dtype=np.float64), shape).copy()
+        self.R_min = np.broadcast_to(np.array(R_min, dtype=np.float64), shape).copy()
+        self._a = 1.0 / window
+        self._d = np.empty(shape)
+        self._y = np.empty(shape)
+        self._tmp = np.empty(shape)
+
+    def _observe(self, y) -> bool:
+        # 観測値の重みが決まってから，カルマンゲインを計算する前に Q, R を推定し直す
+        if self.gate is not None or self.robust is not None:
+            # y - (1 - w) e = H x_p + w e (外れ値のチャンネルは w = 0 なので事前推定値になる)
+            y_w = self._y
+            np.subtract(1.0, self._w, out=y_w)
+            y_w *= self._e
+            np.subtract(y, y_w, out=y_w)
+            y = y_w
+        updated = self.n >= 1
+        if updated:
+            self._update_noise(y)
+        np.copyto(self.y_prev, y)
+        self.n += 1
+        return updated
+
+    def _update_noise(self, y) -> None:
+        a = self._a
+        d = self._d
+        tmp = self._tmp
+
+        # d_t = y_t - F y_{t - 1}
+        np.multiply(self.F, self.y_prev, out=d)
+        np.subtract(y, d, out=d)
+
+        # C_0 = (1 - a) C_0 + a d_t^2
+        np.square(d, out=tmp)
+        tmp *= a
+        self.C_0 *= 1.0 - a
+        self.C_0 += tmp
+
+        # C_1 = (1 - a) C_1 + a d_t d_{t - 1} (最初の d_t には d_{t - 1} がないので C_1 は更新しない)
+        if self.n >= 2:
+            np.multiply(d, self.d_prev, out=tmp)
+            tmp *= a
+            self.C_1 *= 1.0 - a
+            self.C_1 += tmp
+        np.copyto(self.d_prev, d)
+
+        # R = max(-C_1 / F, R_min)
+        np.divide(self.C_1, self.F, out=self.R)
+        np.negative(self.R, out=self.R)
+        np.maximum(self.R, self.R_min, out=self.R)
+
+        # Q = max((C_0 - (1 + F^2) R) / (H^2 G^2), Q_min)
+        np.square(self.F, out=tmp)
+        tmp += 1.0
+        tmp *= self.R
+        np.subtract(self.C_0, tmp, out=self.Q)
+        np.multiply(self.H, self.G, out=tmp)
+        np.square(tmp, out=tmp)
+        self.Q /= tmp
+        np.maximum(self.Q, self.Q_min, out=self.Q)
+
+class FixedLagSmoother:
+    """カルマンフィルタの結果から，lag 時点前の平滑化推定値を求める固定ラグ平滑化
+
+    状態を直近 lag + 1 時点分の (x_t, x_{t - 1}, ..., x_{t - lag}) に拡大したカルマンフィルタと同じ計算をする．
+    各 i について，x_{t - i} の推定値 x_s，その推定誤差の分散 P_s，および x_t の予測誤差との共分散 C を
+    リングバッファに持ち，観測値 y_t を受け取るたびに
+      x_s = x_s + C H / S (y_t - H x_p),  P_s = P_s - C^2 H^2 / S  (S = H^2 P_p + R)
+    で更新する．1 時点あたりの計算は (lag + 1) × チャンネル数の配列の演算だけで，それより古い履歴は持たない．
+
+    kalman_filter の filter / predict の代わりに，この filter / predict を交互に呼ぶ．
+
+    Attributes
+    ----------
+    kalman_filter: KalmanFilter
+        元になるカルマンフィルタ
+    lag: int
+        平滑化の遅れ (何時点前の推定値を出すか)
+    x_s: np.ndarray
+        x_{t - i} の推定値のリングバッファ (lag + 1, チャンネル数)
+    P_s: np.ndarray
+        x_{t - i} の推定誤差の分散のリングバッファ (lag + 1, チャンネル数)
+    C: np.ndarray
+        x_t の予測誤差と x_{t - i} の推定誤差の共分散のリングバッファ (lag + 1, チャンネル数)
+    head: int
+        リングバッファのうち i = 0 (現在の時点) の行
+    count: int
+        これまでに受け取った観測値の数
+    """
+
+    __slots__ = ('kalman_filter', 'lag', 'x_s', 'P_s', 'C', 'head', 'count', '_g', '_nu', '_P_p', '_tmp')
+    checkpoint_fields = ('kalman_filter', 'x_s', 'P_s', 'C', 'head', 'count') # checkpoint.py で保存する属性
+
+    def __init__(self, kalman_filter: KalmanFilter, lag: int):
+        """
+        Parameters
+        ----------
+        kalman_filter: KalmanFilter
+            元になるカルマンフィルタ (まだ filter を呼んでいないもの)
+        lag: int
+            平滑化の遅れ
+        """
+        self.kalman_filter = kalman_filter
+        self.lag = lag
+        s = kalman_filter.state
+        shape = (lag + 1,) + s.x_p.shape
+        self.x_s = np.zeros(shape)
+        self.P_s = np.zeros(shape)
+        self.C = np.zeros(shape)
+        self.head = 0
+        self.count = 0
+        self.x_s[0] = s.x_p
+        self.P_s[0] = s.P_p
+        self.C[0] = s.P_p
+        self._g = np.empty(s.x_p.shape)
+        self._nu = np.empty(s.x_p.shape)
+        self._P_p = np.empty(s.x_p.shape)
+        self._tmp = np.empty(shape)
+
+    @property
+    def ready(self) -> bool:
+        """lag 時点前の平滑化推定値が出せるか (観測値を lag + 1 個以上受け取ったか)"""
+        return self.count > self.lag
+
+    def filter(self, y, out=None, smoothed_out=None) -> None:
+        """観測値を受け取って事後推定値と lag 時点前までの平滑化推定値を更新する
+
+        Parameters
+        ----------
+        y: np.ndarray
+            チャンネルごとの観測値
+        out: np.ndarray, optional
+            指定した場合，事後推定値をこの配列にも書き込む
+        smoothed_out: np.ndarray, optional
+            指定した場合，lag 時点前の平滑化推定値をこの配列に書き込む (ready が False のときは書き込まない)
+        """
+        kf = self.kalman_filter
+        s = kf.state
+        g = self._g
+        nu = self._nu
+        tmp = self._tmp
+        np.copyto(self._P_p, s.P_p)
+        kf.filter(y, out)
+
+        # max_rejections で filter が P_p を広げた場合は，現在の時点の行 (predict で P_p を書き込んだもの) も同じだけ広げる
+        # (広げた分は現在の時点に加わったノイズなので，それより前の時点との共分散は変わらない)
+        np.subtract(s.P_p, self._P_p, out=g)
+        self.P_s[self.head] += g
+        self.C[self.head] += g
+        # g = H / S = K / P_p (S は filter の中で使った値で，外れ値の重みや推定し直した R も反映されている)
+        np.divide(kf._K, s.P_p, out=g)
+
+        # P_s = P_s - C^2 H g
+        np.square(self.C, out=tmp)
+        tmp *= kf.H
+        tmp *= g
+        self.P_s -= tmp
+
+        # x_s = x_s + C g (y - H x_p)
+        np.multiply(kf.H, s.x_p, out=nu)
+        np.subtract(y, nu, out=nu)
+        g *= nu
+        np.multiply(self.C, g, out=tmp)
+        self.x_s += tmp
+
+        # C = C (1 - K H)
+        np.multiply(kf._K, kf.H, out=g)
+        np.subtract(1.0, g, out=g)
+        self.C *= g
+
+        self.count += 1
+        if smoothed_out is not None and self.ready:
+            np.copyto(smoothed_out, self.x_s[(self.head + self.lag) % (self.lag + 1)])
+
+    def predict(self) -> None:
+        """事前推定値を更新して，リングバッファを 1 時点ずらす"""
+        kf = self.kalman_filter
+        s = kf.state
+        kf.predict()
+        self.C *= kf.F
+        self.head = (self.head - 1) % (self.lag + 1) # 最も古い行 (出力済み) を現在の時点に使う
+        self.x_s[self.head] = s.x_p
+        self.P_s[self.head] = s.P_p
+        self.C[self.head] = s.P_p
+
+    def smoothed(self) -> tuple[np.ndarray, np.ndarray]:
+        """lag 時点前の平滑化推定値とその推定誤差の分散を返す (ready が True のときだけ意味がある)"""
+        i = (self.head + self.lag) % (self.lag + 1)
+        return (self.x_s[i], self.P_s[i])
+
+class VectorKalmanFilter:
+    """状態と観測値がベクトルのカルマンフィルタ (x, y, z 軸などを 1 つの状態にまとめたもの)
+
+    filter → predict → filter → predict → ... のように filter と predict を交互に呼んで，state を更新していく．
+    state の x_p, x_f は (状態の次元,)，P_p, P_f は (状態の次元, 状態の次元) の配列になる．
+
+    sequential が True の場合，観測誤差が独立 (R が対角行列) であることを使って，観測値を 1 つずつスカラーとして取り込む．
+    S = H P H^T + R の逆行列 (連立方程式の求解) が要らず，割り算だけで済む．
+    観測値を取り込む順番によらず，結果は一度に取り込んだ場合と (丸め誤差を除いて) 一致する．
+
+    gate, robust, max_rejections は KalmanFilter と同じで，一度に取り込む場合はイノベーションのマハラノビス距離の 2 乗 e^T S^{-1} e，
+    1 つずつ取り込む場合は観測値ごとの e^2 / S で判断する．続けて max_rejections 回捨てたときは，
+    一度に取り込む場合は P_p を e^T S^{-1} e 倍に，1 つずつ取り込む場合は h^T P h が e^2 になるように h の方向に広げて受け入れる．
+
+    Attributes
+    ----------
+    F: np.ndarray
+        状態の推移行列 (状態の次元, 状態の次元)
+    G: np.ndarray
+        システムノイズの係数行列 (状態の次元, システムノイズの次元)
+    H: np.ndarray
+        観測行列 (観測値の次元, 状態の次元)
+    Q: np.ndarray
+        システムノイズの共分散行列 (システムノイズの次元, システムノイズの次元)
+    R: np.ndarray
+        観測誤差の共分散行列 (観測値の次元, 観測値の次元)
+    sequential: bool
+        観測値を 1 つずつ取り込むか
+    gate: float | None
+        外れ値とみなすマハラノビス距離の 2 乗の閾値
+    max_rejections: int | None
+        続けて捨てる観測値の数の上限 (None なら上限なし)
+    robust: str | None
+        'huber' または 'student-t' (robust_weight を参照)
+    huber_k, student_nu: float
+        robust_weight のパラメータ
+    rejected: np.ndarray
+        観測値ごとの，これまでに外れ値として捨てた数 (一度に取り込む場合は観測値のベクトルごと捨てる)
+    consecutive: np.ndarray
+        観測値ごとの，直近で続けて捨てた数
+    state: KalmanFilterState
+        推定値と推定誤差の共分散行列
+    """
+
+    __slots__ = ('F', 'G', 'H', 'Q', 'R', 'sequential', 'gate', 'max_rejections', 'robust', 'huber_k', 'student_nu', 'rejected', 'consecutive', 'state', '_R_diagonal', '_H_index', '_Ph', '_k', '_tmp')
+    checkpoint_fields = ('state', 'rejected', 'consecutive') # checkpoint.py で保存する属性
+
+    def __init__(self, F, G, H, Q, R, x_0, P_0, sequential: bool = False, gate=None, robust=None, huber_k: float = 1.345, student_nu: float = 4.0, max_rejections=None):
+        """
+        Parameters
+        ----------
+        F, G, H, Q: array_like
+            モデルのパラメータ
+        R: array_like
+            観測誤差の共分散行列 (1 次元の配列を渡すと，それを対角成分とする対角行列になる)
+        x_0: array_like
+            事前推定値の初期値
+        P_0: array_like
+            事前推定誤差の共分散行列の初期値
+        sequential: bool
+            観測値を 1 つずつ取り込むか (R が対角行列でなければならない)
+        gate: float, optional
+            外れ値とみなすマハラノビス距離の 2 乗の閾値
+        robust: str, optional
+            'huber' または 'student-t'
+        huber_k, student_nu: float
+            robust_weight のパラメータ
+        max_rejections: int, optional
+            続けて捨てる観測値の数の上限
+        """
+        self.state = KalmanFilterState(x_0, P_0)
+        self.F = np.array(F, dtype=np.float64)
+        self.G = np.array(G, dtype=np.float64)
+        self.H = np.array(H, dtype=np.float64)
+        self.Q = np.array(Q, dtype=np.float64)
+        R = np.array(R, dtype=np.float64)
+        self.R = np.diag(R) if R.ndim == 1 else R
+        self._R_diagonal = np.diag(self.R).copy()
+        if sequential and np.count_nonzero(self.R - np.diag(self._R_diagonal)) > 0:
+            raise ValueError('sequential update requires a diagonal R')
+        self.sequential = sequential
+        self.gate = gate
+        self.max_rejections = max_rejections
+        self.robust = robust
+        self.huber_k = huber_k
+        self.student_nu = student_nu
+        self.rejected = np.zeros(len(self.H), dtype=np.int64)
+        self.consecutive = np.zeros(len(self.H), dtype=np.int64)
+        # H の各行が単位ベクトルなら 1 の位置，そうでなければ -1
+        is_unit = (np.count_nonzero(self.H, axis=1) == 1) & (self.H.max(axis=1) == 1.0)
+        self._H_index = [int(np.argmax(h)) if unit else -1 for (h, unit) in zip(self.H, is_unit)]
+        self._Ph = np.empty(len(self.state.x_p))
+        self._k = np.empty(len(self.state.x_p))
+        self._tmp = np.empty_like(self.state.P_p)
+
+    def filter(self, y, out=None) -> None:
+        """観測値を受け取って事後推定値を更新する
+
+        Parameters
+        ----------
+        y: np.ndarray
+            観測値 (観測値の次元,)
+        out: np.ndarray, optional
+            指定した場合，事後推定値をこの配列にも書き込む
+        """
+        s = self.state
+        if self.sequential:
+            self._filter_sequential(y)
+        else:
+            HP = self.H @ s.P_p
+            S = HP @ self.H.T + self.R
+            e = y - self.H @ s.x_p # イノベーション
+            if self.gate is not None or self.robust is not None:
+                d2 = e @ np.linalg.solve(S, e)
+                if self.gate is not None and d2 > self.gate:
+                    self.consecutive += 1
+                    if self.max_rejections is None or self.consecutive[0] < self.max_rejections: # 外れ値なので観測値を使わない
+                        self.rejected += 1
+                        np.copyto(s.x_f, s.x_p)
+                        np.copyto(s.P_f, s.P_p)
+                        if out is not None:
+                            np.copyto(out, s.x_f)
+                        return
+                    # 値が変わったとみなし，P_p を広げて観測値を受け入れる
+                    s.P_p *= d2
+                    HP = self.H @ s.P_p
+                    S = HP @ self.H.T + self.R
+                    d2 = e @ np.linalg.solve(S, e)
+                self.consecutive.fill(0)
+                w = float(robust_weight(np.float64(d2), self.robust, self.huber_k, self.student_nu, dim=len(y)))
+                S = HP @ self.H.T + self.R / w
+            K = np.linalg.solve(S, HP).T # カルマンゲイン (S は対称なので K = P H^T S^{-1} = (S^{-1} H P)^T)
+            np.add(s.x_p, K @ e, out=s.x_f)
+            np.subtract(s.P_p, K @ HP, out=s.P_f)
+        if out is not None:
+            np.copyto(out, s.x_f)
+
+    def _filter_sequential(self, y) -> None:
+        s = self.state
+        Ph = self._Ph
+        k = self._k
+        tmp = self._tmp
+        np.copyto(s.x_f, s.x_p)
+        np.copyto(s.P_f, s.P_p)
+        for (i, j) in enumerate(self._H_index):
+            if j >= 0: # h が単位ベクトル (状態の j 番目をそのまま観測) なら行列の積は要らない
+                np.copyto(Ph, s.P_f[:, j])
+                S = Ph[j] + self._R_diagonal[i] # スカラー
+                e = y[i] - s.x_f[j] # スカラー
+            else:
+                h = self.H[i]
+                np.dot(s.P_f, h, out=Ph)
+                S = h @ Ph + self._R_diagonal[i]
+                e = y[i] - h @ s.x_f
+            if self.gate is not None or self.robust is not None:
+                d2 = e * e / S
+                if self.gate is not None and d2 > self.gate:
+                    self.consecutive[i] += 1
+                    if self.max_rejections is None or self.consecutive[i] < self.max_rejections: # 外れ値なので観測値を使わない
+                        self.rejected[i] += 1
+                        continue
+                    # 値が変わったとみなし，h^T P h が e^2 になるように P を h の方向に広げて観測値を受け入れる
+                    h = self.H[i]
+                    hh = h @ h
+                    s.P_f += (e * e - (S - self._R_diagonal[i])) / (hh * hh) * np.outer(h, h)
+                    np.dot(s.P_f, h, out=Ph)
+                    S = h @ Ph + self._R_diagonal[i]
+                    d2 = e * e / S
+                self.consecutive[i] = 0
+                w = float(robust_weight(np.float64(d2), self.robust, self.huber_k, self.student_nu))
+                S += self._R_diagonal[i] * (1.0 / w - 1.0) # R を R / w に膨らませる
+            np.divide(Ph, S, out=k) # カルマンゲイン
+            np.outer(k, Ph, out=tmp)
+            s.P_f -= tmp
+            k *= e
+            s.x_f += k
+
+    def predict(self, out=None) -> None:
+        """事前推定値を更新する
+
+        Parameters
+        ----------
+        out: np.ndarray, optional
+            指定した場合，事前推定値をこの配列にも書き込む
+        """
+        s = self.state
+        np.dot(self.F, s.x_f, out=s.x_p)
+        np.dot(self.F @ s.P_f, self.F.T, out=s.P_p)
+        s.P_p += self.G @ self.Q @ self.G.T
+        if out is not None:
+            np.copyto(out, s.x_p)
+
+class InformationFilter:
+    """同じ量を測る複数のセンサーの観測値をまとめて取り込む情報フィルタ (チャンネルごとに独立なスカラー)
+
+    推定誤差の分散 P の代わりに情報量 Y = 1 / P と情報ベクトル y = x / P を持つ．
+    観測更新は，センサー k ごとの H_k^2 / R_k と H_k / R_k をあらかじめ計算しておけば
+      Y_f = Y_p + Σ_k H_k^2 / R_k
+      y_f = y_p + Σ_k (H_k / R_k) y_k
+    と足し算だけになる (Σ_k H_k^2 / R_k はセンサーを追加・削除したときに足し引きして持っておく)．
+    センサーが何台あってもカルマンゲインは計算しない．
+
+    filter → predict → filter → predict → ... のように filter と predict を交互に呼んで，state を更新していく．
+    state には KalmanFilter と同じく x_p, P_p, x_f, P_f が入る．
+
+    Attributes
+    ----------
+    F, G, Q: np.ndarray
+        チャンネルごとのモデルのパラメータ
+    Y_p, y_p: np.ndarray
+        事前推定の情報量と情報ベクトル
+    Y_f, y_f: np.ndarray
+        事後推定の情報量と情報ベクトル
+    information: np.ndarray
+        全センサーの H_k^2 / R_k の和
+    state: KalmanFilterState
+        推定値と推定誤差の分散
+    """
+
+    __slots__ = ('F', 'G', 'Q', 'Y_p', 'y_p', 'Y_f', 'y_f', 'information', 'state', '_H_R', '_H2_R', '_tmp')
+    checkpoint_fields = ('state', 'Y_p', 'y_p', 'Y_f', 'y_f') # checkpoint.py で保存する属性
+
+    def __init__(self, F, G, Q, x_0, P_0):
+        """
+        Parameters
+        ----------
+        F, G, Q: array_like
+            チャンネルごとのモデルのパラメータ (スカラーを渡すと全チャンネル共通になる)
+        x_0: array_like
+            事前推定値の初期値
+        P_0: array_like
+            事前推定誤差の分散の初期値 (スカラーを渡すと全チャンネル共通になる)
+        """
+        shape = np.shape(x_0)
+        self.state = KalmanFilterState(x_0, np.broadcast_to(np.array(P_0, dtype=np.float64), shape))
+        self.F = np.broadcast_to(np.array(F, dtype=np.float64), shape).copy()
+        self.G = np.broadcast_to(np.array(G, dtype=np.float64), shape).copy()
+        self.Q = np.broadcast_to(np.array(Q, dtype=np.float64), shape).copy()
+        self.Y_p = 1.0 / self.state.P_p
+        self.y_p = self.state.x_p * self.Y_p
+        self.Y_f = np.zeros(shape)
+        self.y_f = np.zeros(shape)
+        self.information = np.zeros(shape)
+        self._H_R = np.zeros((0,) + shape) # センサーごとの H_k / R_k
+        self._H2_R = np.zeros((0,) + shape) # センサーごとの H_k^2 / R_k
+        self._tmp = np.zeros((0,) + shape)
+
+    @property
+    def sensor_count(self) -> int:
+        """センサーの数"""
+        return len(self._H_R)
+
+    def add_sensor(self, H, R) -> int:
+        """センサーを追加する
+
+        Parameters
+        ----------
+        H, R: array_like
+            そのセンサーのチャンネルごとの観測のパラメータ
+
+        Returns
+        -------
+        int
+            センサーの番号 (filter に渡す観測値の行)
+        """
+        shape = self.state.x_p.shape
+        H = np.broadcast_to(np.array(H, dtype=np.float64), shape)
+        R = np.broadcast_to(np.array(R, dtype=np.float64), shape)
+        self._H_R = np.concatenate((self._H_R, (H / R)[np.newaxis]))
+        self._H2_R = np.concatenate((self._H2_R, (H ** 2 / R)[np.newaxis]))
+        self._tmp = np.empty_like(self._H_R)
+        self.information += self._H2_R[-1]
+        return len(self._H_R) - 1
+
+    def remove_sensor(self, k: int) -> None:
+        """センサーを削除する (後ろのセンサーの番号は 1 つずつ詰まる)
+
+        Parameters
+        ----------
+        k: int
+            センサーの番号
+        """
+        self.information -= self._H2_R[k]
+        self._H_R = np.delete(self._H_R, k, axis=0)
+        self._H2_R = np.delete(self._H2_R, k, axis=0)
+        self._tmp = np.empty_like(self._H_R)
+
+    def filter(self, y, out=None) -> None:
+        """全センサーの観測値を受け取って事後推定値を更新する
+
+        Parameters
+        ----------
+        y: np.ndarray
+            センサーごと・チャンネルごとの観測値 (センサーの数, チャンネル数)
+        out: np.ndarray, optional
+            指定した場合，事後推定値をこの配列にも書き込む
+        """
+        s = self.state
+        np.add(self.Y_p, self.information, out=self.Y_f)
+        np.multiply(self._H_R, y, out=self._tmp)
+        np.sum(self._tmp, axis=0, out=self.y_f)
+        self.y_f += self.y_p
+        np.divide(1.0, self.Y_f, out=s.P_f)
+        np.multiply(self.y_f, s.P_f, out=s.x_f)
+        if out is not None:
+            np.copyto(out, s.x_f)
+
+    def predict(self, out=None) -> None:
+        """事前推定値を更新する
+
+        Parameters
+        ----------
+        out: np.ndarray, optional
+            指定した場合，事前推定値をこの配列にも書き込む
+        """
+        s = self.state
+        np.multiply(self.F, s.x_f, out=s.x_p)
+        np.square(self.F, out=s.P_p)
+        s.P_p *= s.P_f
+        s.P_p += self.G ** 2 * self.Q
+        np.divide(1.0, s.P_p, out=self.Y_p)
+        np.multiply(s.x_p, self.Y_p, out=self.y_p)
+        if out is not None:
+            np.copyto(out, s.x_p)
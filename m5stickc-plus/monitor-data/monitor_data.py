@@ -1,29 +1,15 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import serial
+import sys
+from time import perf_counter
+import checkpoint
+from decimation import MinMaxPyramid, envelope
+from kalman_filter import AdaptiveKalmanFilter, FixedLagSmoother, InformationFilter, KalmanFilter, VectorKalmanFilter
+from publisher import SamplePublisher
 
-class KalmanFilter:
-    def __init__(self, F, G, H, Q, R):
-        self.F = F
-        self.G = G
-        self.H = H
-        self.Q = Q
-        self.R = R
-    
-    def filter(self, x_prediction, P_prediction, y):
-        K = P_prediction * self.H / (P_prediction * self.H ** 2 + self.R) # カルマンゲイン
-        x_filtering = x_prediction + K * (y - self.H * x_prediction)
-        P_filtering = P_prediction - K * self.H * P_prediction
-        return (x_filtering, P_filtering)
-    
-    def predict(self, x_filtering, P_filtering):
-        x_prediction = self.F * x_filtering
-        P_prediction = (self.F ** 2) * P_filtering + (self.G ** 2) * self.Q
-        return (x_prediction, P_prediction)
-
-list_size_max = 100
-acc_x_list = []
-acc_y_list = []
-acc_z_list = []
+list_size_max = 100 * 60 * 5 # 保持するサンプル数 (100 Hz で 5 分)
+display_size = list_size_max # 表示するサンプル数 (小さくすると直近だけを拡大して表示する)
 
 # 以下，Q, R および初期値は collect_data で収集したデータから計算
 # R は机に置いた状態のデータの標本分散を使用 (Q が 0 の場合に相当)
@@ -36,84 +22,197 @@ acc_z_list = []
 # 初期値の x_prediction は x, y 方向は 0.0 [G]，z 方向は 1.0 [G] とする (理論値を使用)
 # 初期値の P_prediction は Q を使用
 
-acc_x_Q = 0.000093
-acc_x_kalman_filter = KalmanFilter(1.0, 1.0, 1.0, acc_x_Q, 0.000081)
-(acc_x_x_prediction, acc_x_P_prediction) = (0.0, acc_x_Q) # 初期値
-acc_x_x_filtering_list = []
-
-acc_y_Q = 0.000103
-acc_y_kalman_filter = KalmanFilter(1.0, 1.0, 1.0, acc_y_Q, 0.000062)
-(acc_y_x_prediction, acc_y_P_prediction) = (0.0, acc_y_Q) # 初期値
-acc_y_x_filtering_list = []
-
-acc_z_Q = 0.000038
-acc_z_kalman_filter = KalmanFilter(1.0, 1.0, 1.0, acc_z_Q, 0.000056)
-(acc_z_x_prediction, acc_z_P_prediction) = (1.0, acc_z_Q) # 初期値
-acc_z_x_filtering_list = []
-
-
 # cf. [M5Stick-CからMacにBluetoothで文字列を送信する - plant-raspberrypi3のブログ](https://plant-raspberrypi3.hatenablog.com/entry/2020/12/14/232112)
 # cf. [Pythonのpyserialとthreadingでリアルタイムなシリアル通信をする。 #電子工作 - Qiita](https://qiita.com/tapitapi/items/1dd9c66c0dff061bcd82)
-port = '/dev/tty.M5StickCPlus' # NOTE 自分の環境に合わせて変更する
-m5_stick_c_plus = serial.Serial(port, timeout=3)
+# NOTE 自分の環境に合わせて変更する (virtual-device の仮想デバイスを使う場合は表示されたパスを引数で渡す)
+# 引数に複数のポートを渡すと，同じ動きを測る複数台の M5StickC Plus の値を情報フィルタでまとめて取り込む
+ports = sys.argv[1:] if len(sys.argv) > 1 else ['/dev/tty.M5StickCPlus']
+
+# x, y, z 軸の 3 チャンネル分をまとめて 1 つの KalmanFilter で扱う
+acc_Q = np.array([0.000093, 0.000103, 0.000038])
+acc_R = np.array([0.000081, 0.000062, 0.000056])
+# 壊れた行が数値として読めてしまった場合に備えて，イノベーションが大きすぎる観測値は捨てる (または重みを下げる)
+gate = 10.83 # 外れ値とみなす e^2 / S の閾値 (自由度 1 のカイ二乗分布の 99.9% 点)．None なら捨てない
+max_rejections = 3 # 続けてこの回数だけ捨てたら，外れ値ではなく実際に値が変わった (傾けたなど) とみなして受け入れる
+robust = None # 'huber' または 'student-t' にすると，外れ気味の観測値の重みを下げる
+adaptive = False # True にすると Q, R を観測値から推定し直す (上の Q, R は初期値として使う)
+adaptive_window = 200 # Q, R の推定に使う実効的な窓幅 (サンプル数)
+# 運動モデルを指定すると，F = 1 (ランダムウォーク) の代わりにそのモデルで x, y, z を 1 つの VectorKalmanFilter で扱う
+# 例: from motion_models import ConstantVelocity としてから ConstantVelocity(q=0.01)
+#     (他に ConstantAcceleration(q=0.1), Singer(sigma=0.05, tau=0.5) がある)
+# サンプルが届くたびに，直前のサンプルからの間隔 dt で F と Q を離散化して時間更新する (同じ dt の結果はキャッシュされる)
+# 行には時刻が入っていないので，dt には普段はデバイスの送信間隔 sample_interval を使う．
+# 直前のサンプルとこのサンプルの両方を受信バッファが空の状態で待って読んだ場合だけ，届いた時刻の差を dt とする．
+# 描画 (plt.pause) に時間がかかってサンプルが受信バッファに溜まっている間は，読んだ時刻の差はサンプルの間隔ではない
+# (溜まった分を読むたびに描画の時間だけ空くか，ほぼ 0 になる) ので使わない．
+motion_model = None
+sample_interval = 0.01 # デバイスがサンプルを送る間隔 [s]
+
+if motion_model is not None:
+    # 状態は軸ごとに (加速度, その 1 階微分, ...) を並べたもの．観測するのは各軸の加速度だけ
+    dim = motion_model.dim
+    acc_H = np.kron(np.eye(3), np.eye(1, dim))
+    acc_x_0 = np.kron([0.0, 0.0, 1.0], np.eye(1, dim)[0])
+    acc_P_0 = np.diag(np.kron(acc_Q, np.ones(dim)))
+    (acc_F, acc_motion_Q) = motion_model.discretize(sample_interval, axes=3)
+    # この大きさでは一度に取り込む (sequential=False) ほうが 1 サンプルあたり数 µs 速い (benchmark_update.py) が，
+    # 1 つずつ取り込むと gate, robust, max_rejections が KalmanFilter と同じく軸ごとに働く
+    # (1 つの軸だけ壊れた値でも他の軸の観測値は捨てず，gate も自由度 1 の閾値のまま使える) ので，こちらを使う
+    acc_kalman_filter = VectorKalmanFilter(acc_F, np.eye(3 * dim), acc_H, acc_motion_Q, acc_R, x_0=acc_x_0, P_0=acc_P_0, sequential=True, gate=gate, robust=robust, max_rejections=max_rejections) # 初期値
+elif len(ports) > 1:
+    # 複数台の場合は情報フィルタを使う (gate, robust, adaptive, smoother_lag は使わない)
+    # 各台の R は collect_data で台ごとに求めたものを使うのが望ましいが，ここでは同じ値を使う
+    acc_kalman_filter = InformationFilter(1.0, 1.0, acc_Q, x_0=[0.0, 0.0, 1.0], P_0=acc_Q) # 初期値
+    for _ in ports:
+        acc_kalman_filter.add_sensor(1.0, acc_R)
+elif adaptive:
+    acc_kalman_filter = AdaptiveKalmanFilter(1.0, 1.0, 1.0, acc_Q, acc_R, x_0=[0.0, 0.0, 1.0], P_0=acc_Q, window=adaptive_window, gate=gate, robust=robust, max_rejections=max_rejections) # 初期値
+else:
+    acc_kalman_filter = KalmanFilter(1.0, 1.0, 1.0, acc_Q, acc_R, x_0=[0.0, 0.0, 1.0], P_0=acc_Q, gate=gate, robust=robust, max_rejections=max_rejections) # 初期値
+acc_state = acc_kalman_filter.state
+# 各軸の加速度の事後推定値とその分散 (state の配列のビューなので，filter のたびに値が変わる)
+acc_x_f = acc_state.x_f if motion_model is None else acc_state.x_f[::motion_model.dim]
+acc_P_f = acc_state.P_f if motion_model is None else np.diagonal(acc_state.P_f)[::motion_model.dim]
+
+# 0 より大きくすると，その時点数だけ遅れて固定ラグ平滑化した値も表示する (1 台で motion_model を指定しない場合だけ)
+smoother_lag = 0
+acc_smoother = FixedLagSmoother(acc_kalman_filter, smoother_lag) if smoother_lag > 0 and isinstance(acc_kalman_filter, KalmanFilter) else None
+
+# 履歴は最小値・最大値のピラミッド付きのリングバッファ (行がチャンネル，列が時点) に書き込み，サンプルごとにリストを作り直さない
+# 描画するときは画面のピクセル数だけの点に間引いたものを使う
+acc_all = np.empty((len(ports), 3)) # 全台の観測値の作業用バッファ
+acc = acc_all[0] if len(ports) == 1 else np.empty(3) # 表示する観測値 (複数台の場合は平均)
+acc_pyramid = MinMaxPyramid(3, list_size_max)
+acc_x_filtering_pyramid = MinMaxPyramid(3, list_size_max)
+acc_x_smoothing_pyramid = MinMaxPyramid(3, list_size_max) # i 列目には i 時点目の平滑化推定値が入る (smoother_lag だけ遅れて書き込まれる)
+
+# フィルタリング結果をローカルのソケットに配信する場合はアドレスを指定する
+# 例: '/tmp/monitor_data.sock' (Unix ドメインソケット) または ('127.0.0.1', 50007) (TCP)
+# 受け取る側の例は publisher.py を参照
+publish_address = None
+publisher = SamplePublisher(publish_address, channels=3) if publish_address is not None else None
+
+# 長時間動かす場合は，フィルタの状態と履歴を checkpoint_interval 秒ごとにファイルに保存し，次に起動したときにそこから再開する
+# 書き込みは別スレッドで行うので，サンプルのループはディスクへの書き込みを待たない
+# 例: 'monitor_data_checkpoint.npz'
+checkpoint_path = None
+checkpoint_interval = 10.0 # [s]
+checkpoint_objects = {
+    'filter': acc_kalman_filter,
+    'smoother': acc_smoother,
+    'acc': acc_pyramid,
+    'filtering': acc_x_filtering_pyramid,
+    'smoothing': acc_x_smoothing_pyramid,
+}
+checkpoint_writer = None
+if checkpoint_path is not None:
+    saved = checkpoint.load(checkpoint_path)
+    if saved is not None:
+        if checkpoint.restore(checkpoint_objects, saved):
+            print(f'resumed from {checkpoint_path} ({acc_pyramid.count} samples)')
+        else:
+            print(f'{checkpoint_path} does not match the current settings; starting over')
+    checkpoint_writer = checkpoint.CheckpointWriter(checkpoint_path, checkpoint_interval)
+
+def read_acc(device: serial.Serial, out: np.ndarray) -> bool:
+    """x, y, z の加速度を 1 行読んで out に書き込む
+
+    壊れた行は読み飛ばす．タイムアウトして何も読めなかった場合は False を返す．
+    """
+    while True:
+        line = device.readline().strip().decode('utf-8', errors='replace')
+        if not line:
+            print('timeout')
+            return False
+
+        try:
+            acc_data = [float(s) for s in line.split(',')]
+        except ValueError as e:
+            print('parse error:', e)
+            continue
+
+        if len(acc_data) != 3:
+            print('invalid accData')
+            continue
+
+        out[:] = acc_data
+        return True
+
+m5_stick_c_plus_list = [serial.Serial(port, timeout=3) for port in ports]
 fig, (ax1, ax2, ax3) = plt.subplots(3, 1)
-while True:
-    line = m5_stick_c_plus.readline().strip().decode('utf-8')
-    try:
-        acc_data = [float(s) for s in line.split(',')]
-    except ValueError as e:
-        print('parse error:', e)
-        break
-
-    if len(acc_data) != 3:
-        print('invalid accData')
-        break
-
-    acc_x = acc_data[0]
-    acc_y = acc_data[1]
-    acc_z = acc_data[2]
-
-    # 観測更新
-    (acc_x_x_filtering, acc_x_P_filtering) = acc_x_kalman_filter.filter(acc_x_x_prediction, acc_x_P_prediction, acc_x)
-    (acc_y_x_filtering, acc_y_P_filtering) = acc_y_kalman_filter.filter(acc_y_x_prediction, acc_y_P_prediction, acc_y)
-    (acc_z_x_filtering, acc_z_P_filtering) = acc_z_kalman_filter.filter(acc_z_x_prediction, acc_z_P_prediction, acc_z)
-
-    print(f'acc_x: {acc_x} (filtering: {acc_x_x_filtering}), acc_y: {acc_y} (filtering: {acc_y_x_filtering}), acc_z: {acc_z} (filtering: {acc_z_x_filtering})')
-
-    # 時間更新
-    (acc_x_x_prediction, acc_x_P_prediction) = acc_x_kalman_filter.predict(acc_x_x_filtering, acc_x_P_filtering)
-    (acc_y_x_prediction, acc_y_P_prediction) = acc_y_kalman_filter.predict(acc_y_x_filtering, acc_y_P_filtering)
-    (acc_z_x_prediction, acc_z_P_prediction) = acc_z_kalman_filter.predict(acc_z_x_filtering, acc_z_P_filtering)
-
-    acc_x_list.append(acc_x)
-    if len(acc_x_list) > list_size_max:
-        acc_x_list.pop(0)
-    acc_y_list.append(acc_y)
-    if len(acc_y_list) > list_size_max:
-        acc_y_list.pop(0)
-    acc_z_list.append(acc_z)
-    if len(acc_z_list) > list_size_max:
-        acc_z_list.pop(0)
-
-    acc_x_x_filtering_list.append(acc_x_x_filtering)
-    if len(acc_x_x_filtering_list) > list_size_max:
-        acc_x_x_filtering_list.pop(0)
-    acc_y_x_filtering_list.append(acc_y_x_filtering)
-    if len(acc_y_x_filtering_list) > list_size_max:
-        acc_y_x_filtering_list.pop(0)
-    acc_z_x_filtering_list.append(acc_z_x_filtering)
-    if len(acc_z_x_filtering_list) > list_size_max:
-        acc_z_x_filtering_list.pop(0)
-
-    time = range(len(acc_x_list))
-
-    ax1.cla()
-    ax2.cla()
-    ax3.cla()
-    ax1.plot(time, acc_x_list, marker='', ls='-', color='blue')
-    ax1.plot(time, acc_x_x_filtering_list, marker='', ls='--', color='orange')
-    ax2.plot(time, acc_y_list, marker='', ls='-', color='red')
-    ax2.plot(time, acc_y_x_filtering_list, marker='', ls='--', color='darkcyan')
-    ax3.plot(time, acc_z_list, marker='', ls='-', color='green')
-    ax3.plot(time, acc_z_x_filtering_list, marker='', ls='--', color='magenta')
-    plt.pause(0.1)
+sample_time = None # 直前のサンプルが届いた時刻 (受信バッファに溜まっていたものを読んだ場合は None)
+try:
+    while True:
+        waited = motion_model is not None and all(m5_stick_c_plus.in_waiting == 0 for m5_stick_c_plus in m5_stick_c_plus_list) # このサンプルが届くのを待つか
+        if not all(read_acc(m5_stick_c_plus, acc_k) for (m5_stick_c_plus, acc_k) in zip(m5_stick_c_plus_list, acc_all)):
+            break
+        if len(ports) > 1:
+            np.mean(acc_all, axis=0, out=acc)
+
+        # 運動モデルを使う場合の時間更新 (直前のサンプルからこのサンプルまでの dt で離散化する)
+        if motion_model is not None:
+            now = perf_counter() if waited else None
+            if acc_pyramid.count > 0: # 最初のサンプルは初期値をそのまま事前推定値に使う
+                dt = now - sample_time if now is not None and sample_time is not None else sample_interval
+                (acc_kalman_filter.F, acc_kalman_filter.Q) = motion_model.discretize(dt, axes=3)
+                acc_kalman_filter.predict()
+            sample_time = now
+
+        # 観測更新 (事後推定値は履歴バッファの列に直接書き込む)
+        if acc_smoother is not None:
+            acc_smoother.filter(acc, out=acc_x_filtering_pyramid.head(), smoothed_out=acc_x_smoothing_pyramid.head())
+            if acc_smoother.ready:
+                acc_x_smoothing_pyramid.advance()
+        elif motion_model is not None:
+            acc_kalman_filter.filter(acc)
+            np.copyto(acc_x_filtering_pyramid.head(), acc_x_f)
+        elif len(ports) > 1:
+            acc_kalman_filter.filter(acc_all, out=acc_x_filtering_pyramid.head())
+        else:
+            acc_kalman_filter.filter(acc, out=acc_x_filtering_pyramid.head())
+        acc_x_filtering_pyramid.advance()
+        acc_pyramid.append(acc)
+
+        print(f'acc_x: {acc[0]} (filtering: {acc_x_f[0]}), acc_y: {acc[1]} (filtering: {acc_x_f[1]}), acc_z: {acc[2]} (filtering: {acc_x_f[2]})')
+
+        if publisher is not None:
+            publisher.publish(acc, acc_x_f, acc_P_f)
+
+        # 時間更新 (運動モデルを使う場合は次のサンプルが届いてから行う)
+        if acc_smoother is not None:
+            acc_smoother.predict()
+        elif motion_model is None:
+            acc_kalman_filter.predict()
+
+        # 時間更新まで済んだ状態 (運動モデルを使う場合は観測更新まで済んだ状態) を保存する
+        if checkpoint_writer is not None:
+            checkpoint_writer.maybe_save(checkpoint_objects)
+
+        # 軸の幅のピクセル数に合わせて間引いた最小値・最大値を描画する
+        width = int(ax1.bbox.width)
+        (_, time, acc_lo, acc_hi) = acc_pyramid.query(display_size, width)
+        (_, time_filtering, acc_x_filtering_lo, acc_x_filtering_hi) = acc_x_filtering_pyramid.query(display_size, width)
+
+        ax1.cla()
+        ax2.cla()
+        ax3.cla()
+        ax1.plot(*envelope(time, acc_lo[0], acc_hi[0]), marker='', ls='-', color='blue')
+        ax1.plot(*envelope(time_filtering, acc_x_filtering_lo[0], acc_x_filtering_hi[0]), marker='', ls='--', color='orange')
+        ax2.plot(*envelope(time, acc_lo[1], acc_hi[1]), marker='', ls='-', color='red')
+        ax2.plot(*envelope(time_filtering, acc_x_filtering_lo[1], acc_x_filtering_hi[1]), marker='', ls='--', color='darkcyan')
+        ax3.plot(*envelope(time, acc_lo[2], acc_hi[2]), marker='', ls='-', color='green')
+        ax3.plot(*envelope(time_filtering, acc_x_filtering_lo[2], acc_x_filtering_hi[2]), marker='', ls='--', color='magenta')
+        if acc_x_smoothing_pyramid.count > 0:
+            # 平滑化推定値は smoother_lag だけ遅れているので，右端が filtering より手前で終わる
+            (_, time_smoothing, acc_x_smoothing_lo, acc_x_smoothing_hi) = acc_x_smoothing_pyramid.query(display_size - smoother_lag, width)
+            ax1.plot(*envelope(time_smoothing, acc_x_smoothing_lo[0], acc_x_smoothing_hi[0]), marker='', ls=':', color='black')
+            ax2.plot(*envelope(time_smoothing, acc_x_smoothing_lo[1], acc_x_smoothing_hi[1]), marker='', ls=':', color='black')
+            ax3.plot(*envelope(time_smoothing, acc_x_smoothing_lo[2], acc_x_smoothing_hi[2]), marker='', ls=':', color='black')
+        plt.pause(0.1)
+finally:
+    # Ctrl-C で止めた場合も，ソケットのファイルを消して最後の状態を保存する
+    if publisher is not None:
+        publisher.close()
+    if checkpoint_writer is not None:
+        checkpoint_writer.submit(checkpoint.snapshot(checkpoint_objects))
+        checkpoint_writer.close()
@@ -0,0 +1,183 @@
+import functools
+
+import numpy as np
+
+# 次数 7 のパデ近似の係数と，これで倍精度の精度が出るノルムの上限 (Higham, 2005)
+_PADE_7 = (17297280.0, 8648640.0, 1995840.0, 277200.0, 25200.0, 1512.0, 56.0, 1.0)
+_THETA_7 = 0.9504178996162932
+
+def expm(A: np.ndarray) -> np.ndarray:
+    """行列の指数関数 (スケーリングと二乗法 + パデ近似)
+
+    Parameters
+    ----------
+    A: np.ndarray
+        正方行列
+
+    Returns
+    -------
+    np.ndarray
+        exp(A)
+    """
+    norm = np.linalg.norm(A, 1)
+    s = max(0, int(np.ceil(np.log2(norm / _THETA_7)))) if norm > 0.0 else 0
+    A = A / 2 ** s
+    b = _PADE_7
+    I = np.eye(len(A))
+    A2 = A @ A
+    A4 = A2 @ A2
+    A6 = A4 @ A2
+    U = A @ (b[7] * A6 + b[5] * A4 + b[3] * A2 + b[1] * I)
+    V = b[6] * A6 + b[4] * A4 + b[2] * A2 + b[0] * I
+    E = np.linalg.solve(V - U, V + U)
+    for _ in range(s):
+        E = E @ E
+    return E
+
+class MotionModel:
+    """連続時間の運動モデル dx = A x dt + L dβ (β はスペクトル密度 Qc のウィーナー過程)
+
+    discretize(dt) で，サンプリング間隔 dt で離散化した x_t = F x_{t - 1} + w_{t - 1} (w の共分散行列は Q) の F と Q を返す．
+    F = exp(A dt) と Q = ∫_0^dt exp(A s) L Qc L^T exp(A s)^T ds は Van Loan の方法で 1 回の行列の指数関数から求め，
+    結果は dt ごとに LRU キャッシュに入れておく (サンプリング間隔が揺れても，同じ dt なら expm を計算し直さない)．
+    dt は resolution 単位に丸めてからキャッシュのキーにする．
+
+    状態の 0 番目が観測される量 (位置) で，1 番目以降がその 1 階，2 階，... の微分 (速度，加速度，...) になる．
+
+    Attributes
+    ----------
+    A: np.ndarray
+        状態の係数行列
+    L: np.ndarray
+        ノイズの係数行列
+    Qc: np.ndarray
+        ノイズのスペクトル密度
+    dim: int
+        1 軸あたりの状態の次元
+    resolution: float
+        dt を丸める単位 [s]
+    """
+
+    def __init__(self, A, L, Qc, resolution: float = 1e-4):
+        """
+        Parameters
+        ----------
+        A: array_like
+            状態の係数行列
+        L: array_like
+            ノイズの係数行列
+        Qc: array_like
+            ノイズのスペクトル密度
+        resolution: float
+            dt を丸める単位 [s]
+        """
+        self.A = np.array(A, dtype=np.float64)
+        self.L = np.array(L, dtype=np.float64).reshape(len(self.A), -1)
+        self.Qc = np.array(Qc, dtype=np.float64).reshape(self.L.shape[1], self.L.shape[1])
+        self.dim = len(self.A)
+        self.resolution = resolution
+        self._key = (self.A.tobytes(), self.L.tobytes(), self.Qc.tobytes(), self.dim)
+
+    def discretize(self, dt: float, axes: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """サンプリング間隔 dt で離散化した F と Q を返す
+
+        Parameters
+        ----------
+        dt: float
+            サンプリング間隔 [s]
+        axes: int
+            軸の数 (2 以上の場合は，軸ごとの状態を並べたブロック対角行列になる)
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            F と Q (キャッシュを共有しているので書き換えられないようにしてある)
+        """
+        return _discretize(self._key, round(dt / self.resolution), self.resolution, axes)
+
+@functools.lru_cache(maxsize=1024)
+def _discretize(key, steps: int, resolution: float, axes: int) -> tuple[np.ndarray, np.ndarray]:
+    (A, L, Qc, n) = key
+    A = np.frombuffer(A).reshape(n, n)
+    L = np.frombuffer(L).reshape(n, -1)
+    Qc = np.frombuffer(Qc).reshape(L.shape[1], L.shape[1])
+    dt = steps * resolution
+
+    # Van Loan の方法: exp([[-A, L Qc L^T], [0, A^T]] dt) = [[*, F^{-1} Q], [0, F^T]]
+    M = np.zeros((2 * n, 2 * n))
+    M[:n, :n] = -A
+    M[:n, n:] = L @ Qc @ L.T
+    M[n:, n:] = A.T
+    E = expm(M * dt)
+    F = E[n:, n:].T
+    Q = F @ E[:n, n:]
+    Q = (Q + Q.T) / 2 # 丸め誤差で非対称にならないようにする
+
+    if axes > 1:
+        F = np.kron(np.eye(axes), F)
+        Q = np.kron(np.eye(axes), Q)
+    F.flags.writeable = False
+    Q.flags.writeable = False
+    return (F, Q)
+
+def cache_info():
+    """離散化の LRU キャッシュの統計 (functools.lru_cache の cache_info)"""
+    return _discretize.cache_info()
+
+class RandomWalk(MotionModel):
+    """ランダムウォーク (これまでのモデルの F = 1 に当たる)"""
+
+    def __init__(self, q: float, resolution: float = 1e-4):
+        """
+        Parameters
+        ----------
+        q: float
+            位置の変化のスペクトル密度
+        resolution: float
+            dt を丸める単位 [s]
+        """
+        super().__init__([[0.0]], [1.0], q, resolution)
+
+class ConstantVelocity(MotionModel):
+    """等速度モデル (状態は位置と速度，加速度を白色雑音とする)"""
+
+    def __init__(self, q: float, resolution: float = 1e-4):
+        """
+        Parameters
+        ----------
+        q: float
+            加速度のスペクトル密度
+        resolution: float
+            dt を丸める単位 [s]
+        """
+        super().__init__([[0.0, 1.0], [0.0, 0.0]], [0.0, 1.0], q, resolution)
+
+class ConstantAcceleration(MotionModel):
+    """等加速度モデル (状態は位置と速度と加速度，加加速度を白色雑音とする)"""
+
+    def __init__(self, q: float, resolution: float = 1e-4):
+        """
+        Parameters
+        ----------
+        q: float
+            加加速度のスペクトル密度
+        resolution: float
+            dt を丸める単位 [s]
+        """
+        super().__init__([[0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, 0.0]], [0.0, 0.0, 1.0], q, resolution)
+
+class Singer(MotionModel):
+    """Singer モデル (状態は位置と速度と加速度，加速度を時定数 tau の 1 次マルコフ過程とする)"""
+
+    def __init__(self, sigma: float, tau: float, resolution: float = 1e-4):
+        """
+        Parameters
+        ----------
+        sigma: float
+            加速度の標準偏差
+        tau: float
+            加速度の時定数 [s]
+        resolution: float
+            dt を丸める単位 [s]
+        """
+        super().__init__([[0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, -1.0 / tau]], [0.0, 0.0, 1.0], 2.0 * sigma ** 2 / tau, resolution)
@@ -0,0 +1,264 @@
+import collections
+import os
+import selectors
+import socket
+import stat
+import struct
+import sys
+import time
+
+import numpy as np
+
+# フレームの形式 (リトルエンディアン):
+#   ヘッダ: マジック (4 バイト), バージョン (uint16), チャンネル数 (uint16), サンプル数 (uint32)
+#   本体: sample_dtype(チャンネル数) のレコードをサンプル数だけ並べたもの
+FRAME_MAGIC = b'KFMD'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<4sHHI')
+
+def sample_dtype(channels: int) -> np.dtype:
+    """1 サンプル分のレコードの型
+
+    Parameters
+    ----------
+    channels: int
+        チャンネル数
+
+    Returns
+    -------
+    np.dtype
+        通し番号 seq, 時刻 time (UNIX 時間 [s]), 観測値 y, 事後推定値 x_f, 事後推定誤差の分散 P_f を持つ固定長の型
+    """
+    return np.dtype([
+        ('seq', '<u8'),
+        ('time', '<f8'),
+        ('y', '<f8', (channels,)),
+        ('x_f', '<f8', (channels,)),
+        ('P_f', '<f8', (channels,)),
+    ])
+
+class _Subscriber:
+    """購読者ごとの送信待ちのフレーム"""
+
+    __slots__ = ('sock', 'pending', 'offset', 'dropped_frames')
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.pending = collections.deque()
+        self.offset = 0 # pending[0] のうち送信済みのバイト数
+        self.dropped_frames = 0
+
+def _remove_stale_socket(path: str) -> None:
+    # 前回 close せずに終わった (Ctrl-C で止めたなど) ときに残ったソケットのファイルを消す
+    # 接続できる場合は別のプロセスが使っているので，消さずに bind で失敗させる
+    if not os.path.exists(path) or not stat.S_ISSOCK(os.stat(path).st_mode):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+
+class SamplePublisher:
+    """フィルタリング結果をローカルのソケット (Unix ドメインまたは TCP) に配信する
+
+    サンプルは batch_size 個ずつ固定長のバイナリのフレームにまとめて送る．
+    ソケットはすべてノンブロッキングで，購読者の接続・切断や送信は publish / poll の中で待たずに処理する．
+    送信が追いつかない購読者には max_pending フレームまでためて，それを超えた分は捨てて dropped_frames に数える．
+
+    Attributes
+    ----------
+    address: str | tuple[str, int]
+        待ち受けるアドレス (文字列なら Unix ドメインソケットのパス，タプルなら TCP の (ホスト, ポート))
+    channels: int
+        チャンネル数
+    batch_size: int
+        1 フレームにまとめるサンプル数
+    max_pending: int
+        購読者ごとにためておくフレーム数の上限
+    seq: int
+        次のサンプルの通し番号
+    dropped_frames: int
+        これまでに捨てたフレームの数 (切断した購読者の分も含む)
+    """
+
+    def __init__(self, address, channels: int, batch_size: int = 32, max_pending: int = 64):
+        """
+        Parameters
+        ----------
+        address: str | tuple[str, int]
+            待ち受けるアドレス (文字列なら Unix ドメインソケットのパス，タプルなら TCP の (ホスト, ポート))
+        channels: int
+            チャンネル数
+        batch_size: int
+            1 フレームにまとめるサンプル数
+        max_pending: int
+            購読者ごとにためておくフレーム数の上限
+        """
+        self.address = address
+        self.channels = channels
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.seq = 0
+        self.dropped_frames = 0
+        self._batch = np.zeros(batch_size, dtype=sample_dtype(channels))
+        self._batch_len = 0
+        self._subscribers = {}
+        self._selector = selectors.DefaultSelector()
+        if isinstance(address, str):
+            _remove_stale_socket(address)
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._selector.register(self._server, selectors.EVENT_READ)
+
+    @property
+    def subscriber_count(self) -> int:
+        """接続中の購読者の数"""
+        return len(self._subscribers)
+
+    def publish(self, y, x_f, P_f) -> None:
+        """1 サンプル分をバッチに追加し，batch_size 個たまったらフレームにして送る
+
+        Parameters
+        ----------
+        y: np.ndarray
+            チャンネルごとの観測値
+        x_f: np.ndarray
+            チャンネルごとの事後推定値
+        P_f: np.ndarray
+            チャンネルごとの事後推定誤差の分散
+        """
+        record = self._batch[self._batch_len]
+        record['seq'] = self.seq
+        record['time'] = time.time()
+        record['y'] = y
+        record['x_f'] = x_f
+        record['P_f'] = P_f
+        self.seq += 1
+        self._batch_len += 1
+        if self._batch_len == self.batch_size:
+            self.flush()
+        else:
+            self.poll()
+
+    def flush(self) -> None:
+        """たまっているサンプルを (batch_size 個未満でも) フレームにして送る"""
+        if self._batch_len > 0:
+            if self._subscribers:
+                frame = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, self.channels, self._batch_len) + self._batch[:self._batch_len].tobytes()
+                for subscriber in self._subscribers.values():
+                    if len(subscriber.pending) >= self.max_pending:
+                        subscriber.dropped_frames += 1
+                        self.dropped_frames += 1
+                    else:
+                        subscriber.pending.append(frame)
+            self._batch_len = 0
+        self.poll()
+
+    def poll(self) -> None:
+        """待たずに，新しい購読者の接続・切断の処理と送信待ちのフレームの送信をする"""
+        for (key, _) in self._selector.select(timeout=0):
+            if key.fileobj is self._server:
+                self._accept()
+            else:
+                self._read(key.fileobj)
+        for subscriber in list(self._subscribers.values()):
+            self._send(subscriber)
+
+    def close(self) -> None:
+        """たまっているサンプルを送ってから，すべてのソケットを閉じる"""
+        self.flush()
+        for sock in list(self._subscribers):
+            self._detach(sock)
+        self._selector.unregister(self._server)
+        self._server.close()
+        self._selector.close()
+        if isinstance(self.address, str):
+            os.unlink(self.address)
+
+    def _accept(self) -> None:
+        try:
+            (sock, _) = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        self._subscribers[sock] = _Subscriber(sock)
+        self._selector.register(sock, selectors.EVENT_READ) # 購読者からは何も送られてこないので，読めるようになるのは切断されたとき
+
+    def _read(self, sock: socket.socket) -> None:
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._detach(sock)
+
+    def _send(self, subscriber: _Subscriber) -> None:
+        try:
+            while subscriber.pending:
+                frame = subscriber.pending[0]
+                sent = subscriber.sock.send(memoryview(frame)[subscriber.offset:])
+                subscriber.offset += sent
+                if subscriber.offset < len(frame):
+                    return # ソケットのバッファがいっぱいなので，続きは次の poll で送る
+                subscriber.pending.popleft()
+                subscriber.offset = 0
+        except BlockingIOError:
+            return
+        except OSError:
+            self._detach(subscriber.sock)
+
+    def _detach(self, sock: socket.socket) -> None:
+        subscriber = self._subscribers.pop(sock)
+        self.dropped_frames += len(subscriber.pending)
+        self._selector.unregister(sock)
+        sock.close()
+
+def read_frames(sock: socket.socket):
+    """購読者側で，ソケットから受け取ったフレームを 1 つずつ返す
+
+    Parameters
+    ----------
+    sock: socket.socket
+        SamplePublisher に接続したソケット
+
+    Yields
+    ------
+    np.ndarray
+        1 フレーム分のレコードの配列 (型は sample_dtype(チャンネル数))
+    """
+    buffer = bytearray()
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        buffer += data
+        while len(buffer) >= FRAME_HEADER.size:
+            (magic, version, channels, count) = FRAME_HEADER.unpack_from(buffer)
+            if magic != FRAME_MAGIC or version != FRAME_VERSION:
+                raise ValueError(f'invalid frame header: {magic!r}, version {version}')
+            dtype = sample_dtype(channels)
+            size = FRAME_HEADER.size + count * dtype.itemsize
+            if len(buffer) < size:
+                break
+            yield np.frombuffer(bytes(buffer[FRAME_HEADER.size:size]), dtype=dtype)
+            del buffer[:size]
+
+# 購読者の例: python publisher.py /tmp/monitor_data.sock (TCP の場合は python publisher.py 127.0.0.1 50007)
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(sys.argv[1])
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((sys.argv[1], int(sys.argv[2])))
+    for frame in read_frames(sock):
+        for record in frame:
+            print(f'seq: {record["seq"]}, time: {record["time"]:.3f}, y: {record["y"]}, x_f: {record["x_f"]}')
@@ -0,0 +1,229 @@
+import argparse
+import os
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+import serial
+
+# collect_data で収集したデータから計算した標本平均と標本分散 (collect_data.py のコメントを参照)
+NOISE_MODELS = {
+    'desk': (np.array([-0.021590, -0.007404, 1.083106]), np.array([0.000081, 0.000062, 0.000056])), # 机の上
+    'hand': (np.array([-0.103458, -0.033325, 1.071780]), np.array([0.000174, 0.000165, 0.000094])), # 手の上
+}
+
+class VirtualDevice:
+    """M5StickC Plus の代わりに，疑似端末 (pty) に x,y,z\\n の形式で加速度を書き込む仮想デバイス
+
+    collect_data.py や monitor_data.py には port として path を渡せば，実機と同じように serial.Serial で読める．
+    書き込みは経過時間から書くべき行数を計算して，まとめて書く (rate が数万 Hz でも 1 行ずつ sleep しない)．
+    読む側が追いつかないと pty のバッファがいっぱいになって書き込みが待たされるので，
+    実際に書けた行数 lines_written と経過時間から，読む側が処理できた速さがわかる．
+
+    Attributes
+    ----------
+    path: str
+        読む側が開く疑似端末のパス
+    rate: float
+        1 秒あたりに書き込む行数
+    noise: str
+        ノイズのモデル ('desk' または 'hand')
+    drift: np.ndarray
+        平均値のドリフト [G/s]
+    glitch_rate: float
+        数値としては読めるが大きく外れた値 (小数点の欠落) の行を混ぜる割合
+    malformed_rate: float
+        数値として読めない行を混ぜる割合
+    lines_written: int
+        これまでに書き込んだ行数
+    """
+
+    def __init__(self, rate: float = 100.0, noise: str = 'desk', drift=(0.0, 0.0, 0.0), glitch_rate: float = 0.0, malformed_rate: float = 0.0, seed=None):
+        """
+        Parameters
+        ----------
+        rate: float
+            1 秒あたりに書き込む行数
+        noise: str
+            ノイズのモデル ('desk' または 'hand')
+        drift: array_like
+            平均値のドリフト [G/s]
+        glitch_rate: float
+            数値としては読めるが大きく外れた値の行を混ぜる割合
+        malformed_rate: float
+            数値として読めない行を混ぜる割合
+        seed: int, optional
+            乱数のシード
+        """
+        self.rate = rate
+        self.noise = noise
+        self.drift = np.array(drift, dtype=np.float64)
+        self.glitch_rate = glitch_rate
+        self.malformed_rate = malformed_rate
+        self.lines_written = 0
+        self._rng = np.random.default_rng(seed)
+        (self._mean, variance) = NOISE_MODELS[noise]
+        self._scale = np.sqrt(variance)
+        (self._master, self._slave) = os.openpty()
+        tty.setraw(self._slave) # エコーや改行の変換をしない
+        os.set_blocking(self._master, False) # 読む側が追いつかなくても stop で止められるようにする
+        self.path = os.ttyname(self._slave)
+        self._stop = threading.Event()
+
+    def lines(self, n: int) -> bytes:
+        """n 行分のデータを作る
+
+        Parameters
+        ----------
+        n: int
+            行数
+
+        Returns
+        -------
+        bytes
+            x,y,z\\n の形式の n 行
+        """
+        t = (self.lines_written + np.arange(n)) / self.rate
+        acc = self._mean + self.drift * t[:, np.newaxis] + self._rng.normal(0.0, self._scale, (n, 3))
+        lines = [f'{x:.4f},{y:.4f},{z:.4f}' for (x, y, z) in acc.tolist()]
+        if self.glitch_rate > 0.0:
+            for i in np.flatnonzero(self._rng.random(n) < self.glitch_rate):
+                lines[i] = lines[i].replace('.', '', 1) # 小数点が欠けて，1 つ目の値が桁違いになる
+        if self.malformed_rate > 0.0:
+            for i in np.flatnonzero(self._rng.random(n) < self.malformed_rate):
+                lines[i] = lines[i][:self._rng.integers(len(lines[i]))] + '\x00' # 途中で切れて，ゴミが混ざる
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def run(self, duration=None, tick: float = 0.005) -> None:
+        """stop が呼ばれるまで (duration を指定した場合はその秒数だけ) 書き込み続ける
+
+        Parameters
+        ----------
+        duration: float, optional
+            書き込む秒数
+        tick: float
+            書き込みの間隔 [s]
+        """
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            elapsed = time.perf_counter() - start
+            if duration is not None and elapsed >= duration:
+                break
+            n = int(elapsed * self.rate) - self.lines_written
+            if n > 0:
+                try:
+                    self._write(self.lines(n))
+                except OSError: # 読む側がいなくなった
+                    break
+                self.lines_written += n
+            time.sleep(tick)
+
+    def _write(self, data: bytes) -> None:
+        # 読む側が追いつかないと pty のバッファが空くまで待たされる
+        view = memoryview(data)
+        while view and not self._stop.is_set():
+            select.select([], [self._master], [], 0.1)
+            try:
+                view = view[os.write(self._master, view):]
+            except BlockingIOError:
+                continue
+
+    def stop(self) -> None:
+        """run を止める"""
+        self._stop.set()
+
+    def close(self) -> None:
+        """疑似端末を閉じる"""
+        os.close(self._master)
+        os.close(self._slave)
+
+def read_rate(path: str, duration: float) -> tuple[int, int]:
+    """monitor_data.py と同じ方法で duration 秒間読み続けて，読めた行数と読めなかった行数を返す
+
+    Parameters
+    ----------
+    path: str
+        疑似端末のパス
+    duration: float
+        読む秒数
+
+    Returns
+    -------
+    tuple[int, int]
+        読めた行数と，数値として読めなかった行数
+    """
+    port = serial.Serial(path, timeout=3)
+    ok = 0
+    error = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        line = port.readline().strip().decode('utf-8', errors='replace')
+        try:
+            acc_data = [float(s) for s in line.split(',')]
+        except ValueError:
+            error += 1
+            continue
+        if len(acc_data) == 3:
+            ok += 1
+        else:
+            error += 1
+    port.close()
+    return (ok, error)
+
+def load_test(rates, duration: float, noise: str) -> None:
+    """rate を変えながら，読む側が追いつける最大の rate を調べる
+
+    Parameters
+    ----------
+    rates: list[float]
+        試す rate
+    duration: float
+        rate ごとに計測する秒数
+    noise: str
+        ノイズのモデル
+    """
+    max_rate = None
+    for rate in rates:
+        device = VirtualDevice(rate=rate, noise=noise)
+        writer = threading.Thread(target=device.run)
+        writer.start()
+        (ok, error) = read_rate(device.path, duration)
+        device.stop()
+        writer.join()
+        device.close()
+        achieved = ok / duration
+        sustained = achieved >= 0.95 * rate
+        print(f'rate: {rate:.0f} Hz, read: {achieved:.0f} Hz, errors: {error}, {"ok" if sustained else "NG"}')
+        if sustained:
+            max_rate = rate
+        else:
+            break
+    print(f'max sustainable rate: {max_rate} Hz')
+
+# 使い方:
+#   python virtual_device.py --rate 100 --noise hand  (表示されたパスを collect_data.py や monitor_data.py の引数に渡す)
+#   python virtual_device.py --load-test              (読む側が追いつける最大の rate を調べる)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=100.0, help='1 秒あたりに書き込む行数')
+    parser.add_argument('--noise', choices=NOISE_MODELS.keys(), default='desk', help='ノイズのモデル')
+    parser.add_argument('--drift', type=float, nargs=3, default=[0.0, 0.0, 0.0], help='x, y, z の平均値のドリフト [G/s]')
+    parser.add_argument('--glitch-rate', type=float, default=0.0, help='数値としては読めるが大きく外れた値の行を混ぜる割合')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='数値として読めない行を混ぜる割合')
+    parser.add_argument('--seed', type=int, default=None, help='乱数のシード')
+    parser.add_argument('--load-test', action='store_true', help='読む側が追いつける最大の rate を調べる')
+    parser.add_argument('--duration', type=float, default=2.0, help='負荷試験で rate ごとに計測する秒数')
+    args = parser.parse_args()
+
+    if args.load_test:
+        load_test([100.0 * 2 ** i for i in range(12)], args.duration, args.noise)
+    else:
+        device = VirtualDevice(args.rate, args.noise, args.drift, args.glitch_rate, args.malformed_rate, args.seed)
+        print(f'port: {device.path}')
+        try:
+            device.run()
+        except KeyboardInterrupt:
+            pass
+        device.close()
@@ -0,0 +1,410 @@
+import argparse
+import collections
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# self-localization の各スクリプトと monitor_data.py の while True のループを，画面に表示せず，待ち時間なしで動かしてプロファイルを取る
+# スクリプトは書き換えず，読み込み元 (serial.Serial) と描画先 (plt.subplots, plt.pause など) だけを差し替える
+#
+# 使い方:
+#   python profile_harness.py kalman-filter --repeat 100                   (シミュレーション + 描画なし)
+#   python profile_harness.py monitor-data --source virtual --sink agg     (仮想デバイスから読んで Agg で描画)
+#   python profile_harness.py monitor-data --source recorded.txt           (x,y,z の行を記録したファイルを読む)
+#   python profile_harness.py monitor-data --profiler pyinstrument         (pyinstrument が入っている場合)
+#
+# 出力先 (--output) には次のファイルができる
+#   profile.prof: cProfile の結果 (snakeviz や flameprof でそのまま開ける)
+#   profile.txt: cProfile の結果を累積時間の順に並べたもの
+#   pyinstrument.html: pyinstrument の結果 (--profiler pyinstrument の場合)
+#   stages.txt: 段階 (読み込み，シミュレーション，フィルタリング，履歴，出力，描画) ごとの時間と割合 (--profiler cprofile の場合)
+#   stages.folded: 段階を根にした関数ごとの時間 [µs] (flamegraph.pl や speedscope にそのまま渡せる形式)
+# 段階ごとの時間は cProfile の関数ごとの tottime を段階に振り分けて求める (stage_times を参照)
+# スクリプトが savefig で保存する画像も出力先に書かれる (元のディレクトリの画像は上書きしない)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# シナリオ名: (スクリプトのパス，観測値をシリアルポートから読むか)
+SCENARIOS = {
+    'simple-robot': ('self-localization/simple-robot/simple-robot.py', False),
+    'simple-robot-control': ('self-localization/simple-robot-control/simple-robot-control.py', False),
+    'kalman-filter': ('self-localization/kalman-filter/kalman-filter.py', False),
+    'kalman-filter-control': ('self-localization/kalman-filter-control/kalman-filter-control.py', False),
+    'multi-robot': ('self-localization/multi-robot/multi-robot.py', False),
+    'collect-data': ('m5stickc-plus/collect-data/collect_data.py', True),
+    'monitor-data': ('m5stickc-plus/monitor-data/monitor_data.py', True),
+}
+
+STAGES = ('ingestion', 'simulation', 'filtering', 'history', 'output', 'plotting', 'script')
+
+# (段階, ファイル名に含まれる文字列 (None ならどのファイルでも), 関数名 (None ならどの関数でも)) を上から順に見て，
+# 最初に当てはまったものをその関数の段階とする
+_STAGE_RULES = [
+    ('ingestion', ('/serial/', 'virtual_device.py'), None),
+    ('ingestion', None, ('read_acc',)),
+    ('ingestion', ('profile_harness.py',), ('readline',)),
+    ('output', ('publisher.py', 'checkpoint.py'), None),
+    ('output', ('profile_harness.py',), ('write',)),
+    ('output', ('~',), ("<built-in method builtins.print>",)),
+    ('history', ('decimation.py',), ('head', 'advance', 'append')),
+    ('plotting', ('/matplotlib/', '/PIL/', 'decimation.py'), None),
+    ('plotting', ('profile_harness.py',), ('_draw', '__getattr__', '_noop', '_null_subplots')),
+    ('filtering', ('kalman_filter.py', 'motion_models.py'), None),
+    ('filtering', None, ('filter', 'predict', 'smoothed')),
+    ('simulation', None, ('observe', 'move', '_normal')),
+]
+
+def classify(function) -> str | None:
+    """cProfile の関数 (ファイル名, 行番号, 関数名) がどの段階か判定する
+
+    Parameters
+    ----------
+    function: tuple[str, int, str]
+        pstats.Stats.stats のキー
+
+    Returns
+    -------
+    str | None
+        STAGES のいずれか (どれにも当てはまらない numpy の関数などは None)
+    """
+    (filename, _, name) = function
+    for (stage, files, names) in _STAGE_RULES:
+        if (files is None or any(f in filename for f in files)) and (names is None or name in names):
+            return stage
+    return None
+
+def stage_times(stats: pstats.Stats) -> tuple[dict, dict]:
+    """cProfile の結果から，段階ごとの時間を求める
+
+    各関数の tottime (その関数自身で使った時間) を段階に振り分ける．
+    classify で段階が決まらない関数 (numpy の関数や組み込み関数など) の tottime は，
+    呼び出し元ごとの時間の比で呼び出し元の段階に振り分ける (呼び出し元も決まらなければさらにその呼び出し元をたどる)．
+
+    Parameters
+    ----------
+    stats: pstats.Stats
+        cProfile の結果
+
+    Returns
+    -------
+    tuple[dict[str, float], dict[tuple[str, tuple[str, int, str]], float]]
+        段階ごとの時間 [s] と，(段階, 関数) ごとの時間 [s]
+    """
+    raw = stats.stats
+    shares = {}
+
+    def share(function) -> dict:
+        # function の tottime をどの段階にどれだけの割合で振り分けるか
+        if function in shares:
+            return shares[function]
+        stage = classify(function)
+        if stage is not None or function not in raw:
+            shares[function] = {stage or 'script': 1.0}
+            return shares[function]
+        shares[function] = {'script': 1.0} # 再帰呼び出しでたどり直さないようにする
+        callers = raw[function][4]
+        # 呼び出し元ごとの，その呼び出し元から呼ばれたときの tottime (どれも 0 なら呼び出し回数) の比で振り分ける
+        weights = {caller: c[2] for (caller, c) in callers.items()}
+        if not any(weights.values()):
+            weights = {caller: c[1] for (caller, c) in callers.items()}
+        total = sum(weights.values())
+        result = collections.Counter()
+        for (caller, weight) in weights.items():
+            for (s, x) in share(caller).items():
+                result[s] += weight / total * x
+        shares[function] = dict(result) if result else {'script': 1.0}
+        return shares[function]
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 10000))
+    try:
+        totals = collections.Counter()
+        functions = collections.Counter()
+        for (function, (_, _, tottime, _, _)) in raw.items():
+            for (stage, x) in share(function).items():
+                totals[stage] += tottime * x
+                functions[(stage, function)] += tottime * x
+    finally:
+        sys.setrecursionlimit(limit)
+    return (totals, functions)
+
+def stage_report(totals: dict) -> str:
+    """段階ごとの時間と割合の表を返す"""
+    total = sum(totals.values())
+    lines = [f'{"stage":<12} {"time [s]":>9} {"share":>7}']
+    for stage in STAGES:
+        t = totals.get(stage, 0.0)
+        lines.append(f'{stage:<12} {t:9.3f} {t / total if total else 0.0:7.1%}')
+    return '\n'.join(lines)
+
+def stage_folded(functions: dict) -> str:
+    """flamegraph.pl の入力形式 (1 行に '段階;関数 マイクロ秒') で返す"""
+    lines = []
+    for ((stage, (filename, lineno, name)), t) in sorted(functions.items(), key=lambda item: -item[1]):
+        us = round(t * 1e6)
+        if us > 0:
+            label = name if filename == '~' else f'{name} ({Path(filename).name}:{lineno})'
+            lines.append(f'{stage};{label} {us}\n')
+    return ''.join(lines)
+
+class _Discard(io.TextIOBase):
+    """print の出力を捨てる (print 自体の時間は output として計る)"""
+
+    def write(self, s: str) -> int:
+        return len(s)
+
+class _Null:
+    """null シンクで plt.subplots が返す図と軸 (何を呼んでも何もしない)"""
+
+    class bbox:
+        width = 640.0 # monitor_data.py が間引く点の数に使う
+
+    def _noop(self, *args, **kwargs):
+        return None
+
+    def __getattr__(self, name: str):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._noop
+
+def _null_subplots(nrows: int = 1, ncols: int = 1, **kwargs):
+    if nrows * ncols == 1:
+        return (_Null(), _Null())
+    axes = np.empty(nrows * ncols, dtype=object)
+    for i in range(len(axes)):
+        axes[i] = _Null()
+    return (_Null(), axes.reshape(nrows, ncols).squeeze())
+
+@contextlib.contextmanager
+def sink(kind: str):
+    """描画先を差し替える
+
+    null: 図を作らない (描画のコストを除いたループの時間)
+    agg: Agg で描画だけ行う (画面には出さない)
+    live: 画面に表示する (plt.pause の待ち時間の代わりにイベントを処理するだけ)
+    いずれも plt.pause と plt.show では待たない．null と agg では print の出力を捨てる．
+
+    Parameters
+    ----------
+    kind: str
+        'null', 'agg' または 'live'
+    """
+    import matplotlib
+    if kind != 'live':
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    def _draw(interval=None):
+        fig = plt.gcf()
+        fig.canvas.draw()
+        if kind == 'live':
+            fig.canvas.flush_events()
+
+    saved = {name: getattr(plt, name) for name in ('subplots', 'pause', 'show')}
+    stdout = sys.stdout
+    plt.show = lambda *args, **kwargs: None
+    if kind == 'null':
+        plt.subplots = _null_subplots
+        plt.pause = lambda interval: None
+    else:
+        plt.pause = _draw
+    if kind == 'live':
+        plt.ion()
+    else:
+        sys.stdout = _Discard()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+        for (name, value) in saved.items():
+            setattr(plt, name, value)
+        plt.close('all')
+
+class _ReplaySerial:
+    """あらかじめ用意した行を返す serial.Serial の代わり (行がなくなったらタイムアウトと同じく b'' を返す)"""
+
+    def __init__(self, lines, samples: int):
+        self._lines = lines[:samples]
+        self._index = 0
+
+    @property
+    def in_waiting(self) -> int:
+        # 待たずに返すので，残りの行はすべて受信バッファに溜まっているものとして扱う
+        return sum(len(line) for line in self._lines[self._index:])
+
+    def readline(self) -> bytes:
+        if self._index == len(self._lines):
+            return b''
+        self._index += 1
+        return self._lines[self._index - 1]
+
+    def close(self) -> None:
+        pass
+
+@contextlib.contextmanager
+def source(kind: str, samples: int, rate: float):
+    """serial.Serial を差し替えて，スクリプトが読む観測値の元を切り替える
+
+    simulated: virtual-device と同じノイズのモデルで作った行を，待たずに返す
+    virtual: virtual-device の仮想デバイスを rate [Hz] で動かして，本物の serial.Serial で読む
+    それ以外: x,y,z の行を記録したファイルのパスとみなして，その行を待たずに返す
+    いずれも samples 行を読んだところで b'' を返して，スクリプトのループを終わらせる．
+
+    Parameters
+    ----------
+    kind: str
+        'simulated', 'virtual' またはファイルのパス
+    samples: int
+        読む行数
+    rate: float
+        仮想デバイスの 1 秒あたりの行数
+    """
+    import serial
+    sys.path.insert(0, str(ROOT / 'm5stickc-plus' / 'virtual-device'))
+    try:
+        from virtual_device import NOISE_MODELS, VirtualDevice
+    finally:
+        sys.path.pop(0)
+
+    device = None
+    if kind == 'simulated':
+        (mean, variance) = NOISE_MODELS['hand']
+        acc = np.random.default_rng(0).normal(mean, np.sqrt(variance), (samples, 3))
+        lines = [f'{x:.4f},{y:.4f},{z:.4f}\n'.encode('utf-8') for (x, y, z) in acc.tolist()]
+        factory = lambda port, **kwargs: _ReplaySerial(lines, samples)
+    elif kind == 'virtual':
+        device = VirtualDevice(rate=rate, noise='hand')
+        writer = threading.Thread(target=device.run, daemon=True)
+        writer.start()
+
+        class _LimitedSerial(serial.Serial):
+            def readline(self) -> bytes:
+                self._count = getattr(self, '_count', 0) + 1
+                return super().readline() if self._count <= samples else b''
+
+        factory = lambda port, **kwargs: _LimitedSerial(device.path, **kwargs)
+    else:
+        with open(kind, 'rb') as f:
+            lines = f.readlines()
+        factory = lambda port, **kwargs: _ReplaySerial(lines, samples)
+
+    saved = serial.Serial
+    serial.Serial = factory
+    try:
+        yield
+    finally:
+        serial.Serial = saved
+        if device is not None:
+            device.stop()
+            writer.join()
+            device.close()
+
+def run(scenario: str, source_kind: str, sink_kind: str, samples: int, repeat: int, rate: float, profiler: str, interval: float, output: Path) -> dict | None:
+    """シナリオを repeat 回動かしてプロファイルを取り，output に書き出す
+
+    Parameters
+    ----------
+    scenario: str
+        SCENARIOS のキー
+    source_kind: str
+        source を参照
+    sink_kind: str
+        sink を参照
+    samples: int
+        シリアルポートから読むシナリオで読む行数
+    repeat: int
+        スクリプトを動かす回数 (self-localization のスクリプトはゴールに着くと終わるので，何回か動かす)
+    rate: float
+        仮想デバイスの 1 秒あたりの行数
+    profiler: str
+        'cprofile' または 'pyinstrument'
+    interval: float
+        pyinstrument のサンプリングの間隔 [s]
+    output: Path
+        出力先のディレクトリ
+
+    Returns
+    -------
+    dict[str, float] | None
+        段階ごとの時間 [s] (pyinstrument の場合は None)
+    """
+    (path, serial_input) = SCENARIOS[scenario]
+    script = str(ROOT / path)
+    output.mkdir(parents=True, exist_ok=True)
+    ports = ['profile'] # スクリプトに渡すポート名 (実際には source が差し替えたものを読む)
+
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler # 入っていない場合は pip install pyinstrument
+        profile = Profiler(interval=interval)
+        (start, stop) = (profile.start, profile.stop)
+    else:
+        profile = cProfile.Profile()
+        (start, stop) = (profile.enable, profile.disable)
+
+    cwd = os.getcwd()
+    argv = sys.argv
+    sys.path.insert(0, str(Path(script).parent))
+    os.chdir(output)
+    try:
+        with contextlib.ExitStack() as stack:
+            if serial_input:
+                stack.enter_context(source(source_kind, samples, rate))
+            elif source_kind != 'simulated':
+                raise ValueError(f'{scenario} simulates its own robot; --source must be simulated')
+            stack.enter_context(sink(sink_kind))
+            sys.argv = [script] + (ports if serial_input else [])
+            elapsed = time.perf_counter()
+            start()
+            try:
+                for _ in range(repeat):
+                    runpy.run_path(script, run_name='__main__')
+            finally:
+                stop()
+                elapsed = time.perf_counter() - elapsed
+    finally:
+        sys.argv = argv
+        os.chdir(cwd)
+        sys.path.remove(str(Path(script).parent))
+
+    print(f'{scenario}: {elapsed:.3f} s ({repeat} run(s), source: {source_kind}, sink: {sink_kind}, profiler: {profiler})')
+    if profiler == 'pyinstrument':
+        (output / 'pyinstrument.html').write_text(profile.output_html())
+        print(profile.output_text(unicode=True))
+        print('stages.txt and stages.folded are written only with --profiler cprofile')
+        return None
+
+    profile.dump_stats(output / 'profile.prof')
+    text = io.StringIO()
+    stats = pstats.Stats(profile, stream=text)
+    stats.sort_stats('cumulative').print_stats(40)
+    (output / 'profile.txt').write_text(text.getvalue())
+    pstats.Stats(profile).sort_stats('cumulative').print_stats(15)
+    (totals, functions) = stage_times(stats)
+    (output / 'stages.txt').write_text(stage_report(totals) + '\n')
+    (output / 'stages.folded').write_text(stage_folded(functions))
+    print(stage_report(totals))
+    return totals
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenario', choices=SCENARIOS.keys(), help='動かすスクリプト')
+    parser.add_argument('--source', default='simulated', help="観測値の元 ('simulated', 'virtual' または x,y,z の行を記録したファイルのパス)")
+    parser.add_argument('--sink', choices=('null', 'agg', 'live'), default='null', help='描画先')
+    parser.add_argument('--samples', type=int, default=3000, help='シリアルポートから読むシナリオで読む行数')
+    parser.add_argument('--repeat', type=int, default=1, help='スクリプトを動かす回数')
+    parser.add_argument('--rate', type=float, default=100.0, help='仮想デバイスの 1 秒あたりの行数')
+    parser.add_argument('--profiler', choices=('cprofile', 'pyinstrument'), default='cprofile', help='使うプロファイラ (段階ごとの時間は cprofile の場合だけ出力する)')
+    parser.add_argument('--interval', type=float, default=0.001, help='pyinstrument のサンプリングの間隔 [s]')
+    parser.add_argument('--output', type=Path, default=Path('profile-output'), help='出力先のディレクトリ')
+    args = parser.parse_args()
+
+    run(args.scenario, args.source, args.sink, args.samples, args.repeat, args.rate, args.profiler, args.interval, args.output.resolve())
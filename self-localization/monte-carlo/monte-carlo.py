@@ -0,0 +1,94 @@
+import shutil
+import time
+
+import numpy as np
+from result_store import ResultReader, ResultWriter
+
+# kalman-filter.py と同じ直線上のロボットとカルマンフィルタを，観測誤差の分散 R を変えながら何度も動かし，
+# 各時点の t, x, y, x_p, P_p, x_f, P_f を result_store の形式で保存する．
+# 保存した結果は動かし直さずに ResultReader で読んで集計できる (最後の集計がその例)．
+#
+# 行は実行ごとにまとまっている (run 番目の実行の t 時点目は run * n_steps + t 行目) ので，
+# 1 回分の軌跡は column('x', run * n_steps, (run + 1) * n_steps) で読める．
+
+results_path = 'monte-carlo-results'
+x_0 = 0.0
+S = 0.5
+Q = 0.5
+R_list = [0.5, 2.0, 8.0] # 変える観測誤差の分散
+n_runs = 10000 # R ごとの実行回数
+n_steps = 30 # 1 回あたりの時点数
+batch_size = 10000 # まとめて動かす実行回数
+u = 1.0 # 毎時点 1.0 移動するという指令
+
+# R ごとに独立な乱数生成器を作る (R_list を増やしても既存の R の結果は変わらない)
+generators = [np.random.default_rng(s) for s in np.random.SeedSequence(736848565429029).spawn(len(R_list))]
+
+shutil.rmtree(results_path, ignore_errors=True)
+steps = ResultWriter(f'{results_path}/steps', {
+    'run': np.int64, 't': np.int32,
+    'x': np.float64, 'y': np.float64, 'x_p': np.float64, 'P_p': np.float64, 'x_f': np.float64, 'P_f': np.float64,
+})
+runs = ResultWriter(f'{results_path}/runs', {'run': np.int64, 'Q': np.float64, 'R': np.float64})
+
+start = time.perf_counter()
+run = 0
+for (R, rng) in zip(R_list, generators):
+    for n in [batch_size] * (n_runs // batch_size) + [n_runs % batch_size]:
+        if n == 0:
+            continue
+        # 時点 × 実行の配列で，n 回分の実行をまとめて動かす
+        shape = (n_steps, n)
+        x = np.empty(shape)
+        y = np.empty(shape)
+        x_p = np.empty(shape)
+        P_p = np.empty(shape)
+        x_f = np.empty(shape)
+        P_f = np.empty(shape)
+
+        # Robot と同じく，S, Q, R を rng.normal の標準偏差として渡している
+        x[0] = x_0 + rng.normal(0.0, S, n)
+        x_p[0] = x_0
+        P_p[0] = S
+        for t in range(n_steps):
+            y[t] = x[t] + rng.normal(0.0, R, n) # observe
+            K = P_p[t] / (P_p[t] + R) # filter
+            x_f[t] = x_p[t] + K * (y[t] - x_p[t])
+            P_f[t] = P_p[t] - K * P_p[t]
+            if t + 1 < n_steps:
+                x[t + 1] = x[t] + u + rng.normal(0.0, Q, n) # move
+                x_p[t + 1] = x_f[t] + u # predict
+                P_p[t + 1] = P_f[t] + Q
+
+        # 実行ごとに行がまとまるように，転置してから追記する
+        run_ids = run + np.arange(n)
+        steps.extend(
+            run=np.repeat(run_ids, n_steps), t=np.tile(np.arange(n_steps), n),
+            x=x.T.ravel(), y=y.T.ravel(), x_p=x_p.T.ravel(), P_p=P_p.T.ravel(), x_f=x_f.T.ravel(), P_f=P_f.T.ravel(),
+        )
+        runs.extend(run=run_ids, Q=np.full(n, Q), R=np.full(n, R))
+        run += n
+steps.close()
+runs.close()
+print(f'wrote {steps.rows} rows ({run} runs) in {time.perf_counter() - start:.2f} s')
+
+# 保存した結果の集計: R ごとの，観測値と事後推定値の二乗誤差の平均 (チャンクごとに読むので全体はメモリに載せない)
+steps = ResultReader(f'{results_path}/steps')
+runs = ResultReader(f'{results_path}/runs')
+R_of_run = runs.column('R')
+setting = np.searchsorted(R_list, R_of_run) # R_list は昇順
+y_error = np.zeros(len(R_list))
+x_f_error = np.zeros(len(R_list))
+count = np.zeros(len(R_list))
+for (_, chunk) in steps.iter_chunks(['run', 'x', 'y', 'x_f']):
+    k = setting[chunk['run']]
+    y_error += np.bincount(k, (chunk['y'] - chunk['x']) ** 2, len(R_list))
+    x_f_error += np.bincount(k, (chunk['x_f'] - chunk['x']) ** 2, len(R_list))
+    count += np.bincount(k, minlength=len(R_list))
+for (R, e_y, e_f, c) in zip(R_list, y_error, x_f_error, count):
+    print(f'R: {R}, y_error: {e_y / c:.4f}, x_f_error: {e_f / c:.4f}')
+
+# 1 回分の軌跡だけを読む例 (読むのはその範囲を含むチャンクのその部分だけ)
+run = 12345
+trajectory = steps.read(['x', 'y', 'x_f'], run * n_steps, (run + 1) * n_steps)
+print(f'run {run}: x_f_error: {np.mean((trajectory["x_f"] - trajectory["x"]) ** 2):.4f}')
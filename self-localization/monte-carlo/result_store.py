@@ -0,0 +1,263 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+# 結果を列ごと・チャンクごとの .npy ファイルに分けて保存する
+#
+#   path/
+#     manifest.json        列の dtype と形，チャンクごとの行数
+#     000000/x.npy         0 番目のチャンクの x 列
+#     000000/x_f.npy
+#     000001/x.npy
+#     ...
+#
+# .npy は圧縮しないので，読むときは np.load(mmap_mode='r') でメモリマップでき，
+# 必要な列の必要な行の範囲だけがディスクから読まれる
+
+MANIFEST = 'manifest.json'
+
+class ResultWriter:
+    """1 行ずつ (または数行ずつ) 追記した結果を，chunk_rows 行ごとにまとめて書き出す
+
+    チャンクは一時ディレクトリに書いてから名前を変え，manifest.json も一時ファイルから置き換えるので，
+    途中で止まっても，manifest.json に載っているチャンクはすべて読める．
+    同じ path を開き直すと，既存のチャンクの後ろに追記する (列の定義は同じでなければならない)．
+
+    Attributes
+    ----------
+    path: Path
+        保存先のディレクトリ
+    columns: dict[str, tuple[np.dtype, tuple[int, ...]]]
+        列名と，その dtype と 1 行あたりの形
+    chunk_rows: int
+        1 チャンクの行数
+    rows: int
+        これまでに追記した行数 (書き出し待ちの行も含む)
+    """
+
+    def __init__(self, path, columns: dict, chunk_rows: int = 1 << 16):
+        """
+        Parameters
+        ----------
+        path: str | Path
+            保存先のディレクトリ
+        columns: dict[str, dtype | tuple[dtype, tuple[int, ...]]]
+            列名と dtype (1 行が配列の場合は dtype と形の組)
+        chunk_rows: int
+            1 チャンクの行数
+        """
+        self.path = Path(path)
+        self.columns = {}
+        for (name, spec) in columns.items():
+            (dtype, shape) = spec if isinstance(spec, tuple) else (spec, ())
+            self.columns[name] = (np.dtype(dtype), tuple(shape))
+        self.chunk_rows = chunk_rows
+        self._buffers = {name: np.empty((chunk_rows,) + shape, dtype) for (name, (dtype, shape)) in self.columns.items()}
+        self._n = 0 # 書き出し待ちの行数
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifest = _read_manifest(self.path)
+        if manifest is None:
+            self._chunks = []
+        else:
+            if _decode_columns(manifest['columns']) != self.columns:
+                raise ValueError(f'{self.path} was written with different columns')
+            self._chunks = manifest['chunks']
+        self.rows = sum(self._chunks)
+
+    def append(self, **values) -> None:
+        """1 行を追記する
+
+        Parameters
+        ----------
+        **values
+            列名と値 (すべての列を指定する)
+        """
+        for (name, buffer) in self._buffers.items():
+            buffer[self._n] = values[name]
+        self._n += 1
+        self.rows += 1
+        if self._n == self.chunk_rows:
+            self.flush()
+
+    def extend(self, **values) -> None:
+        """複数行をまとめて追記する
+
+        Parameters
+        ----------
+        **values
+            列名と値の配列 (先頭の軸が行．すべての列を同じ行数で指定する)
+        """
+        arrays = {name: np.asarray(values[name]) for name in self._buffers}
+        n = len(next(iter(arrays.values())))
+        i = 0
+        while i < n:
+            m = min(n - i, self.chunk_rows - self._n)
+            for (name, buffer) in self._buffers.items():
+                buffer[self._n:self._n + m] = arrays[name][i:i + m]
+            self._n += m
+            self.rows += m
+            i += m
+            if self._n == self.chunk_rows:
+                self.flush()
+
+    def flush(self) -> None:
+        """書き出し待ちの行を 1 つのチャンクとして書き出す"""
+        if self._n == 0:
+            return
+        name = f'{len(self._chunks):06d}'
+        tmp = self.path / (name + '.tmp')
+        if tmp.exists():
+            shutil.rmtree(tmp) # 前回途中で止まったときの残り
+        tmp.mkdir()
+        for (column, buffer) in self._buffers.items():
+            np.save(tmp / f'{column}.npy', buffer[:self._n])
+        if (self.path / name).exists():
+            shutil.rmtree(self.path / name) # manifest.json に載る前に止まったときの残り
+        os.replace(tmp, self.path / name)
+        self._chunks.append(self._n)
+        self._n = 0
+        _write_manifest(self.path, {'columns': _encode_columns(self.columns), 'chunks': self._chunks})
+
+    def close(self) -> None:
+        """書き出し待ちの行を書き出す"""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ResultReader:
+    """ResultWriter で書き出した結果を，必要な列と行の範囲だけ読む
+
+    列はチャンクごとにメモリマップするだけで，実際に読むのは要求された範囲だけになる．
+    範囲が 1 つのチャンクに収まる場合はメモリマップのビューをそのまま返し (コピーしない)，
+    複数のチャンクにまたがる場合はその範囲だけを連結する．
+
+    Attributes
+    ----------
+    path: Path
+        保存先のディレクトリ
+    columns: dict[str, tuple[np.dtype, tuple[int, ...]]]
+        列名と，その dtype と 1 行あたりの形
+    chunks: list[int]
+        チャンクごとの行数
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str | Path
+            保存先のディレクトリ
+        """
+        self.path = Path(path)
+        manifest = _read_manifest(self.path)
+        if manifest is None:
+            raise FileNotFoundError(self.path / MANIFEST)
+        self.columns = _decode_columns(manifest['columns'])
+        self.chunks = manifest['chunks']
+        self._offsets = np.concatenate([[0], np.cumsum(self.chunks, dtype=np.int64)]) # チャンクの先頭の行番号
+        self._maps = {}
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def _map(self, chunk: int, column: str) -> np.ndarray:
+        key = (chunk, column)
+        if key not in self._maps:
+            if column not in self.columns:
+                raise KeyError(column)
+            self._maps[key] = np.load(self.path / f'{chunk:06d}' / f'{column}.npy', mmap_mode='r')
+        return self._maps[key]
+
+    def column(self, name: str, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """1 つの列の [start, stop) 行目を返す
+
+        Parameters
+        ----------
+        name: str
+            列名
+        start: int
+            最初の行
+        stop: int, optional
+            最後の行の次 (省略した場合は最後まで)
+
+        Returns
+        -------
+        np.ndarray
+            (stop - start, 1 行あたりの形) の配列 (1 つのチャンクに収まる場合は読み取り専用のメモリマップ)
+        """
+        (start, stop, _) = slice(start, stop).indices(len(self))
+        first = int(np.searchsorted(self._offsets, start, side='right')) - 1
+        parts = []
+        for chunk in range(max(first, 0), len(self.chunks)):
+            offset = self._offsets[chunk]
+            if offset >= stop:
+                break
+            parts.append(self._map(chunk, name)[max(start - offset, 0):stop - offset])
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            (dtype, shape) = self.columns[name]
+            return np.empty((0,) + shape, dtype)
+        return np.concatenate(parts)
+
+    def read(self, names, start: int = 0, stop: int | None = None) -> dict:
+        """複数の列の [start, stop) 行目を返す
+
+        Parameters
+        ----------
+        names: list[str]
+            列名
+        start: int
+            最初の行
+        stop: int, optional
+            最後の行の次 (省略した場合は最後まで)
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            列名と column の結果
+        """
+        return {name: self.column(name, start, stop) for name in names}
+
+    def iter_chunks(self, names):
+        """チャンクごとに列を返す (全体をメモリに載せずに集計するときに使う)
+
+        Parameters
+        ----------
+        names: list[str]
+            列名
+
+        Yields
+        ------
+        tuple[int, dict[str, np.ndarray]]
+            チャンクの先頭の行番号と，列名とメモリマップの辞書
+        """
+        for chunk in range(len(self.chunks)):
+            yield (int(self._offsets[chunk]), {name: self._map(chunk, name) for name in names})
+
+def _encode_columns(columns: dict) -> dict:
+    return {name: {'dtype': dtype.str, 'shape': list(shape)} for (name, (dtype, shape)) in columns.items()}
+
+def _decode_columns(columns: dict) -> dict:
+    return {name: (np.dtype(spec['dtype']), tuple(spec['shape'])) for (name, spec) in columns.items()}
+
+def _read_manifest(path: Path):
+    try:
+        with open(path / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_manifest(path: Path, manifest: dict) -> None:
+    tmp = path / (MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path / MANIFEST)
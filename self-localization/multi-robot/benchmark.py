@@ -0,0 +1,25 @@
+import time
+
+import numpy as np
+from robots import BatchKalmanFilter, Robots
+
+# ロボットの台数を変えながら，1 時点分 (observe → filter → move → predict) にかかる時間を計る
+n_landmarks = 4
+n_steps = 50
+landmarks = np.random.default_rng(0).uniform(0.0, 30.0, (n_landmarks, 2))
+
+for n_robots in [1, 10, 100, 1000, 10000, 100000]:
+    x_0 = np.zeros((n_robots, 2))
+    robots = Robots(x_0=x_0, S=0.5, Q=0.5, R=2.0, landmarks=landmarks, generator=np.random.default_rng(n_robots))
+    kalman_filter = BatchKalmanFilter(x_0=x_0, S=0.5, Q=0.5, R=2.0, landmarks=landmarks)
+    u = np.array([1.0, 0.5])
+
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        robots.observe()
+        kalman_filter.filter(robots.y)
+        robots.move(u)
+        kalman_filter.predict(u)
+    elapsed = (time.perf_counter() - start) / n_steps
+
+    print(f'robots: {n_robots:6d}, step: {elapsed * 1e3:8.3f} ms, per robot: {elapsed / n_robots * 1e6:8.3f} us')
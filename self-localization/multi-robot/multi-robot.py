@@ -0,0 +1,75 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from robots import BatchKalmanFilter, Robots
+
+rng = np.random.default_rng(736848565429029)
+# rng = np.random.default_rng() # シードを固定しない場合はこちらを使用
+
+n_robots = 200
+landmarks = [[0.0, 0.0], [30.0, 0.0], [0.0, 30.0], [30.0, 30.0]] # 目印の位置
+x_0 = rng.uniform(0.0, 10.0, (n_robots, 2)) # 初期位置の指定位置は左下の 10 × 10 の範囲に散らばらせる
+
+# S=0.5 なので，初期位置は指定位置の周辺
+# Q=0.5, R=2.0 なので，指令からのズレより観測誤差の方が大きい (原点から遠い目印ほど見にくいことにして R を大きくする)
+R = [2.0, 3.0, 3.0, 4.0]
+robots = Robots(x_0=x_0, S=0.5, Q=0.5, R=R, landmarks=landmarks, generator=rng)
+
+# robots と同じパラメータの値で kalman_filter を作る
+kalman_filter = BatchKalmanFilter(x_0=x_0, S=0.5, Q=0.5, R=R, landmarks=landmarks)
+
+goal = 20.0 # ループを抜けるためにゴールを設定 (全台の事後推定値の x 座標の平均で判断する)
+
+len_max = 35
+y_error_list = []
+x_f_error_list = []
+
+fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+xy_min = -5.0
+xy_max = 35.0
+
+while True:
+    x = robots.x # ロボットの位置
+
+    robots.observe() # 目印の相対位置を観測させる
+    y = robots.y # 目印の相対位置の観測値
+
+    kalman_filter.filter(y) # 観測値が得られたので事後推定値を更新
+    x_f = kalman_filter.x_f # ロボットの位置の事後推定値
+
+    # 1 つ目の目印の観測値だけから求めた位置と，事後推定値の誤差 (全台の平均二乗誤差の平方根)
+    y_error = np.sqrt(np.mean(np.sum((robots.landmarks[0] - y[:, 0, :] - x) ** 2, axis=1)))
+    x_f_error = np.sqrt(np.mean(np.sum((x_f - x) ** 2, axis=1)))
+
+    y_error_list.append(y_error)
+    if len(y_error_list) > len_max:
+        y_error_list.pop(0)
+    x_f_error_list.append(x_f_error)
+    if len(x_f_error_list) > len_max:
+        x_f_error_list.pop(0)
+
+    print(f'y_error: {y_error}, x_f_error: {x_f_error}')
+
+    ax1.cla()
+    ax1.set_xlim(xy_min, xy_max)
+    ax1.set_ylim(xy_min, xy_max)
+    ax1.set_aspect('equal')
+    ax1.plot(robots.landmarks[:, 0], robots.landmarks[:, 1], marker='s', ls='', color='black')
+    ax1.plot(x[:, 0], x[:, 1], marker='o', ls='', color='blue')
+    ax1.plot(x_f[:, 0], x_f[:, 1], marker='d', ls='', color='green')
+
+    ax2.cla()
+    ax2.set_xlim(0, len_max)
+    ax2.set_ylim(0.0, 5.0)
+    ax2.plot(range(len(y_error_list)), y_error_list, marker='x', ls='--', color='red')
+    ax2.plot(range(len(x_f_error_list)), x_f_error_list, marker='d', ls='-.', color='green')
+
+    if np.mean(x_f[:, 0]) >= goal: # 事後推定値でゴールに到達したか判断する
+        print(f'goal! x_f_error: {x_f_error}')
+        plt.show()
+        break # ゴールを超えていたら終わり
+
+    plt.pause(0.5)
+
+    u = np.array([1.0, 0.5]) # 全台が x 方向に 1.0，y 方向に 0.5 移動するという指令
+    robots.move(u) # 指令を渡してロボットを移動させる
+    kalman_filter.predict(u) # 指令を渡して事前推定値を更新
@@ -0,0 +1,151 @@
+import numpy as np
+
+class Robots:
+    """平面上を移動する N 台のロボット
+
+    直線上を移動する Robot を平面上の N 台に拡張したもの．
+    各ロボットは K 個の目印それぞれについて，自分から見た目印の相対位置 (目印の位置 - 自分の位置) を観測する．
+    observe → move → observe → move → ... のように observe と move を交互に呼んで，全台を一度に動かす．
+
+    Attributes
+    ----------
+    x: np.ndarray
+        ロボットの位置 (N, 2)
+    y: np.ndarray
+        目印の相対位置の観測値 (N, K, 2)
+    landmarks: np.ndarray
+        目印の位置 (K, 2)
+    Q: float
+        ロボットが移動するときの指令からのズレの分散 (x, y 方向それぞれ)
+    R: np.ndarray
+        目印ごとの観測誤差の分散 (K,) (x, y 方向それぞれ)
+    rng: np.random.Generator
+        乱数生成器
+    """
+
+    def __init__(self, x_0, S: float, Q: float, R, landmarks, generator: np.random.Generator | None = None):
+        """
+        Parameters
+        ----------
+        x_0: array_like
+            初期位置の指定位置 (N, 2)
+        S: float
+            初期位置の指定位置からのズレの分散
+        Q: float
+            ロボットが移動するときの指令からのズレの分散
+        R: float | array_like
+            観測誤差の分散 (目印ごとに変える場合は (K,))
+        landmarks: array_like
+            目印の位置 (K, 2)
+        generator: np.random.Generator, optional
+            乱数生成器 (省略した場合はシードを固定せずに作る)
+        """
+        self.rng = generator if generator is not None else np.random.default_rng()
+        self.landmarks = np.array(landmarks, dtype=np.float64)
+        x_0 = np.array(x_0, dtype=np.float64)
+        self.x = x_0 + self.rng.normal(0.0, np.sqrt(S), x_0.shape)
+        self.y = np.zeros((len(x_0), len(self.landmarks), 2)) # まだ何も観測していないということ (0.0 という値に意味はない)
+        self.Q = Q
+        self.R = np.broadcast_to(np.array(R, dtype=np.float64), (len(self.landmarks),)).copy()
+
+    def observe(self) -> None:
+        """全台が全目印の相対位置を観測する
+
+        観測値 y が更新される．
+        """
+        v = self.rng.standard_normal(self.y.shape)
+        v *= np.sqrt(self.R)[:, np.newaxis]
+        np.subtract(self.landmarks, self.x[:, np.newaxis, :], out=self.y)
+        self.y += v
+
+    def move(self, u) -> None:
+        """指令 (移動量) を受け取って全台が移動する
+
+        Parameters
+        ----------
+        u: array_like
+            指令 (移動量) ((N, 2) または全台共通の (2,))
+        """
+        w = self.rng.standard_normal(self.x.shape)
+        w *= np.sqrt(self.Q)
+        self.x += u
+        self.x += w
+
+class BatchKalmanFilter:
+    """Robots の位置を全台まとめて推定するカルマンフィルタ
+
+    観測方程式は y_k = l_k - x + v_k (l_k は k 番目の目印の位置) で，観測誤差は目印ごと・方向ごとに独立とする．
+    このとき H^T R^{-1} H = (Σ_k 1 / R_k) I となるので，観測更新を情報行列の形で
+      P_f = (P_p^{-1} + (Σ_k 1 / R_k) I)^{-1}
+      x_f = x_p + P_f Σ_k (-(y_k - l_k + x_p) / R_k)
+    と書けば，2K × 2K 行列の逆行列は要らず，1 台あたり 2 × 2 行列の逆行列だけで済む．
+    計算はすべて (N, ...) の配列の演算で，ロボットの台数についてループしない．
+
+    Attributes
+    ----------
+    x_p: np.ndarray
+        位置の事前推定値 (N, 2)
+    P_p: np.ndarray
+        事前推定誤差の共分散行列 (N, 2, 2)
+    x_f: np.ndarray
+        位置の事後推定値 (N, 2)
+    P_f: np.ndarray
+        事後推定誤差の共分散行列 (N, 2, 2)
+    Q: float
+        位置が推移するときの指令からのズレの分散
+    R: np.ndarray
+        目印ごとの観測誤差の分散 (K,)
+    landmarks: np.ndarray
+        目印の位置 (K, 2)
+    """
+
+    def __init__(self, x_0, S: float, Q: float, R, landmarks):
+        """
+        Parameters
+        ----------
+        x_0: array_like
+            初期位置の指定位置 (N, 2)
+        S: float
+            初期位置の指定位置からのズレの分散
+        Q: float
+            位置が推移するときの指令からのズレの分散
+        R: float | array_like
+            観測誤差の分散 (目印ごとに変える場合は (K,))
+        landmarks: array_like
+            目印の位置 (K, 2)
+        """
+        self.landmarks = np.array(landmarks, dtype=np.float64)
+        self.x_p = np.array(x_0, dtype=np.float64)
+        n = len(self.x_p)
+        self.P_p = np.broadcast_to(S * np.eye(2), (n, 2, 2)).copy()
+        self.x_f = np.zeros((n, 2)) # まだ何もフィルタリングしていないということ (0.0 という値に意味はない)
+        self.P_f = np.zeros((n, 2, 2)) # まだ何もフィルタリングしていないということ (0.0 という値に意味はない)
+        self.Q = Q
+        self.R = np.broadcast_to(np.array(R, dtype=np.float64), (len(self.landmarks),)).copy()
+        self._R_inv = 1.0 / self.R
+        self._information = self._R_inv.sum() * np.eye(2) # H^T R^{-1} H (全台共通)
+
+    def filter(self, y) -> None:
+        """全台の観測値を受け取って事後推定値を更新する
+
+        Parameters
+        ----------
+        y: np.ndarray
+            目印の相対位置の観測値 (N, K, 2)
+        """
+        # 目印ごとの観測値から求めた位置 l_k - y_k を 1 / R_k で重み付けして足す (H^T R^{-1} (y - H x_p) に当たる)
+        z = np.einsum('k,nkd->nd', self._R_inv, self.landmarks - y)
+        z -= self._R_inv.sum() * self.x_p
+        self.P_f = np.linalg.inv(np.linalg.inv(self.P_p) + self._information)
+        self.x_f = self.x_p + np.einsum('nij,nj->ni', self.P_f, z)
+
+    def predict(self, u) -> None:
+        """全台の指令 (推移量) を受け取って事前推定値を更新する
+
+        Parameters
+        ----------
+        u: array_like
+            指令 (推移量) ((N, 2) または全台共通の (2,))
+        """
+        self.x_p = self.x_f + u
+        self.P_p = self.P_f + self.Q * np.eye(2)
@@ -3,6 +3,9 @@ import matplotlib.pyplot as plt
 
 rng = np.random.default_rng(736848565429029)
 # rng = np.random.default_rng() # シードを固定しない場合はこちらを使用
+# 複数のシミュレーションを並列に動かす場合は，SeedSequence から独立な乱数生成器を作って Robot ごとに渡す:
+#   generators = [np.random.default_rng(s) for s in np.random.SeedSequence(736848565429029).spawn(n)]
+#   robots = [Robot(x_0=0.0, S=0.5, Q=0.5, R=2.0, generator=g) for g in generators]
 
 class Robot:
     """直線上を移動する簡単なロボット
@@ -19,9 +22,13 @@ class Robot:
         ロボットが移動するときの指令からのズレの分散
     R: float
         観測誤差の分散
+    rng: np.random.Generator
+        このロボットが使う乱数生成器
+    block_size: int
+        0 より大きい場合，標準正規乱数を block_size 個ずつまとめて生成しておき，そこから 1 つずつ使う
     """
 
-    def __init__(self, x_0: float, S: float, Q: float, R: float):
+    def __init__(self, x_0: float, S: float, Q: float, R: float, generator: np.random.Generator | None = None, block_size: int = 0):
         """
         Parameters
         ----------
@@ -33,18 +40,37 @@ class Robot:
             ロボットが移動するときの指令からのズレの分散
         R: float
             観測誤差の分散
+        generator: np.random.Generator, optional
+            このロボットが使う乱数生成器 (省略した場合はモジュールの rng を使う)
+        block_size: int
+            0 より大きい場合，標準正規乱数を block_size 個ずつまとめて生成しておき，そこから 1 つずつ使う
+            (呼び出しごとに rng.normal を呼ばないので速いが，block_size が 0 の場合とは乱数の系列が変わる)
         """
-        self.x = x_0 + rng.normal(0.0, S)
+        self.rng = generator if generator is not None else rng
+        self.block_size = block_size
+        self._block = np.empty(block_size)
+        self._block_index = block_size # まだ生成していないということ
+        self.x = x_0 + self._normal(S)
         self.y = 0.0 # まだ何も観測していないということ (0.0 という値に意味はない)
         self.Q = Q
         self.R = R
 
+    def _normal(self, scale: float) -> float:
+        if self.block_size == 0:
+            return self.rng.normal(0.0, scale)
+        if self._block_index == self.block_size:
+            self.rng.standard_normal(out=self._block)
+            self._block_index = 0
+        z = self._block[self._block_index]
+        self._block_index += 1
+        return float(scale * z)
+
     def observe(self) -> None:
         """距離を観測する
 
         距離の観測値が更新される．
         """
-        v = rng.normal(0.0, self.R)
+        v = self._normal(self.R)
         self.y = self.x + v
 
     def move(self, u: float) -> None:
@@ -57,7 +83,7 @@ class Robot:
         u: float
             指令 (移動量)
         """
-        w = rng.normal(0.0, self.Q)
+        w = self._normal(self.Q)
         self.x = self.x + u + w
 
 # x_0=0.0, S=0.5 なので，初期位置は 0.0 周辺